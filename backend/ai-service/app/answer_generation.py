@@ -3,21 +3,127 @@ Answer Generation Service for QuerySense
 Generates direct answers to user questions based on retrieved documents using local AI models
 """
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 import re
-import csv
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from io import StringIO
+import pandas as pd
 import torch
+import transformers
 from transformers import (
     AutoTokenizer, 
     AutoModelForQuestionAnswering, 
     AutoModelForCausalLM,
+    BitsAndBytesConfig,
     pipeline
 )
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Fixed generation length keeps the compiled decode graph shape stable
+CONTEXTUAL_MAX_NEW_TOKENS = 100
+# Token budget for document context inside the 512-token generation prompt
+CONTEXTUAL_CONTEXT_TOKENS = 384
+
+# Concurrent contextual-answer prompts are coalesced into one padded generate() call
+GENERATION_BATCH_SIZE = 8
+GENERATION_BATCH_WINDOW_SECONDS = 0.01
+# Batch sizes and prompt lengths the compiled generator is captured for; batches are padded up
+# to the next bucket so a request never brings a new shape (and a recompile) to the compiled forward
+GENERATION_BATCH_BUCKETS = (1, 2, 4, 8)
+GENERATION_PROMPT_BUCKETS = (128, 256, 512)
+
+# Accepted settings.quantization values; the CPU path only honors bf16 (everything else loads fp32)
+TEXT_GEN_QUANTIZATIONS = ("auto", "fp16", "bf16", "int8", "int4")
+CPU_TEXT_GEN_QUANTIZATIONS = ("auto", "bf16")
+
+# Extractive QA runs one (question, document) pair per candidate document in batches;
+# long documents are split into overlapping token windows so every span is reachable
+QA_BATCH_SIZE = 8
+QA_MAX_SEQ_LEN = 384
+QA_DOC_STRIDE = 128
+
+# Question classifier keywords, compiled once into a single alternation per category
+DATA_KEYWORDS = ['most', 'least', 'total', 'count', 'budget', 'department', 'employee', 'people', 
+                 'staff', 'performance', 'rating', 'largest', 'smallest', 'highest', 'lowest',
+                 'how many', 'which department', 'what department']
+ONBOARDING_KEYWORDS = ['first day', 'onboard', 'new employee', 'orientation', 'checklist',
+                       'meet with', 'who should i', 'what should i', 'security badge', 
+                       'laptop', 'manager', 'office tour']
+POLICY_KEYWORDS = ['vacation', 'time off', 'sick leave', 'holiday', 'policy', 'benefits',
+                   'days per year', 'request', 'approval']
+
+_DATA_RE = re.compile('|'.join(map(re.escape, DATA_KEYWORDS)))
+_ONBOARDING_RE = re.compile('|'.join(map(re.escape, ONBOARDING_KEYWORDS)))
+_POLICY_RE = re.compile('|'.join(map(re.escape, POLICY_KEYWORDS)))
+
+# Document section extractors (applied to lowercased content)
+_CHECKLIST_RE = re.compile(r'## first day checklist\s*\n((?:- .+\n?)+)', re.MULTILINE)
+_CHECKLIST_ITEM_RE = re.compile(r'- (.+)')
+_HR_TIME_RE = re.compile(r'report to hr at (\d+:\d+\s*[ap]m)')
+_TRAINING_RE = re.compile(r'## training requirements\s*\n(.+?)(?=\n##|\Z)', re.DOTALL)
+_ENTITLEMENT_RE = re.compile(r'## vacation entitlement\s*\n((?:- .+\n?)+)', re.MULTILINE)
+
+# Word tokenizer for answer-to-document attribution
+_WORD_RE = re.compile(r'\w+')
+
+# Department CSV columns used by the data-question handlers
+CSV_TEXT_COLUMNS = ('Department', 'Performance Rating')
+CSV_INT_COLUMNS = ('Employee Count', 'Budget 2024')
+# Parsed CSV summaries kept per distinct document content (least recently used evicted first)
+CSV_CACHE_SIZE = 64
+# Word sets kept per distinct document content for answer attribution
+DOC_TOKEN_CACHE_SIZE = 1024
+
+QUESTION_DATA, QUESTION_ONBOARDING, QUESTION_POLICY = 0, 1, 2
+_CATEGORY_PATTERNS = {
+    QUESTION_DATA: (DATA_KEYWORDS, _DATA_RE),
+    QUESTION_ONBOARDING: (ONBOARDING_KEYWORDS, _ONBOARDING_RE),
+    QUESTION_POLICY: (POLICY_KEYWORDS, _POLICY_RE),
+}
+
+# All category keywords compiled ahead of time into one Hyperscan DFA (optional dependency)
+try:
+    import hyperscan
+    _classifier_expressions = []
+    _classifier_ids = []
+    for _category, (_keywords, _) in _CATEGORY_PATTERNS.items():
+        for _keyword in _keywords:
+            _classifier_expressions.append(re.escape(_keyword).encode())
+            _classifier_ids.append(_category)
+    _CLASSIFIER_DB = hyperscan.Database()
+    _CLASSIFIER_DB.compile(
+        expressions=_classifier_expressions,
+        ids=_classifier_ids,
+        elements=len(_classifier_expressions),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(_classifier_expressions)
+    )
+    USE_HYPERSCAN = True
+except Exception:
+    _CLASSIFIER_DB = None
+    USE_HYPERSCAN = False
+
+# Hyperscan scratch space is not thread-safe
+_CLASSIFIER_LOCK = threading.Lock()
+
+def _content_hash(content: str) -> str:
+    """128-bit digest of document content (cache keys must change whenever any byte changes)"""
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+def _content_lower(doc: Dict[str, Any]) -> str:
+    """Return the document's lowercased content, computed once and stashed on the doc dict"""
+    content_lower = doc.get('_content_lower')
+    if content_lower is None:
+        content_lower = doc.get('content', '').lower()
+        doc['_content_lower'] = content_lower
+    return content_lower
+
 class AnswerGenerationService:
     """Service to generate answers from retrieved documents using local AI models"""
     
@@ -26,6 +132,15 @@ class AnswerGenerationService:
         self.qa_pipeline = None
         self.text_generator = None
         self.tokenizer = None
+        # Parsed CSV rows and aggregates keyed by content hash (LRU, CSV_CACHE_SIZE entries)
+        self._csv_cache: OrderedDict = OrderedDict()
+        # Lowercased word sets per document, keyed by content hash (LRU, DOC_TOKEN_CACHE_SIZE entries)
+        self._doc_token_cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Pending (prompt, future) pairs consumed by the generation batching worker
+        self._generation_queue: Optional[queue.Queue] = None
+        # Generation batches are padded to fixed (batch, prompt length) buckets once the model is compiled
+        self._pad_to_buckets = False
         
     def initialize(self):
         """Initialize the local AI models for answer generation"""
@@ -39,7 +154,8 @@ class AnswerGenerationService:
                     "question-answering",
                     model=settings.qa_model,
                     tokenizer=settings.qa_model,
-                    device=0 if self.device == "cuda" else -1
+                    device=0 if self.device == "cuda" else -1,
+                    batch_size=QA_BATCH_SIZE
                 )
                 
                 # Initialize text generation model for more complex reasoning
@@ -47,13 +163,42 @@ class AnswerGenerationService:
                 self.tokenizer = AutoTokenizer.from_pretrained(settings.text_gen_model)
                 self.text_generator = AutoModelForCausalLM.from_pretrained(
                     settings.text_gen_model,
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    device_map="auto" if self.device == "cuda" else None
+                    **self._text_generator_load_kwargs()
                 )
                 
                 # Add padding token if it doesn't exist
                 if self.tokenizer.pad_token is None:
                     self.tokenizer.pad_token = self.tokenizer.eos_token
+                # Left padding keeps prompts adjacent to generated tokens in a batch
+                self.tokenizer.padding_side = "left"
+                
+                # Inference only: disable dropout and any gradient-checkpointing hooks
+                for model in (self.qa_pipeline.model, self.text_generator):
+                    model.eval()
+                    if getattr(model, "is_gradient_checkpointing", False):
+                        model.gradient_checkpointing_disable()
+                
+                # Pre-allocate the KV-cache once so the decode loop can be graph-captured
+                # (needs transformers >= 4.38 and an architecture with StaticCache support)
+                if getattr(self.text_generator, "_supports_static_cache", False):
+                    self.text_generator.generation_config.cache_implementation = "static"
+                else:
+                    logger.info(
+                        f"ℹ️ Static KV-cache unsupported for {settings.text_gen_model} on transformers "
+                        f"{transformers.__version__}; generating with the dynamic cache"
+                    )
+                
+                # Compile the decoder forward once so generate() runs fused CUDA-graph kernels; only with the
+                # static cache, as dynamic-cache decode steps change shape every token and would re-record graphs
+                if self.device == "cuda" and getattr(self.text_generator.generation_config, "cache_implementation", None) == "static":
+                    self._compile_text_generator()
+                elif self.device == "cuda":
+                    logger.info("ℹ️ Dynamic KV-cache in use, keeping the eager text generation forward")
+                
+                self._start_generation_worker()
+                
+                if self.device == "cuda":
+                    self._warm_up_models()
                 
                 logger.info("✅ Local AI models initialized successfully")
             else:                logger.info("✅ Answer generation service initialized (rule-based fallback)")
@@ -63,6 +208,154 @@ class AnswerGenerationService:
             logger.error(f"❌ Failed to initialize answer generation: {e}")
             return False
     
+    def _text_generator_load_kwargs(self) -> Dict[str, Any]:
+        """Pick weight precision/quantization for the text generation model from settings.quantization"""
+        quantization = settings.quantization.lower()
+        if quantization not in TEXT_GEN_QUANTIZATIONS:
+            logger.warning(
+                f"⚠️ Unknown quantization '{settings.quantization}' (expected one of "
+                f"{', '.join(TEXT_GEN_QUANTIZATIONS)}); using auto"
+            )
+            quantization = "auto"
+        
+        if self.device != "cuda":
+            # bf16 halves weight bandwidth on CPUs with native bf16 support (AVX512-BF16/AMX)
+            if quantization not in CPU_TEXT_GEN_QUANTIZATIONS:
+                logger.warning(f"⚠️ quantization={quantization} is not supported on CPU; loading float32 weights")
+            dtype = torch.bfloat16 if quantization == "bf16" else torch.float32
+            logger.info(f"🔢 Text generation precision: {dtype} (cpu)")
+            return {"torch_dtype": dtype}
+        
+        half_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        load_kwargs: Dict[str, Any] = {"device_map": "auto"}
+        
+        if quantization == "int8":
+            load_kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+        elif quantization == "int4":
+            load_kwargs["quantization_config"] = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=half_dtype
+            )
+        elif quantization == "fp16":
+            load_kwargs["torch_dtype"] = torch.float16
+        else:
+            if quantization == "bf16" and half_dtype != torch.bfloat16:
+                logger.warning("⚠️ quantization=bf16 is not supported on this GPU; loading float16 weights")
+            load_kwargs["torch_dtype"] = half_dtype
+        
+        resolved = load_kwargs.get("torch_dtype", quantization)
+        logger.info(f"🔢 Text generation precision: {quantization} -> {resolved} (cuda)")
+        return load_kwargs
+    
+    def _compile_text_generator(self):
+        """Wrap the causal-LM forward with torch.compile and pay the compile cost up front"""
+        eager_forward = self.text_generator.forward
+        try:
+            logger.info("⚙️ Compiling text generation model (reduce-overhead)...")
+            self.text_generator.forward = torch.compile(
+                self.text_generator.forward,
+                mode="reduce-overhead",
+                fullgraph=False
+            )
+            
+            # Warm-up: one padded generate() per (batch, prompt length) bucket, so compilation and graph
+            # capture happen here rather than on the first request of each shape
+            self._pad_to_buckets = True
+            for batch_size in GENERATION_BATCH_BUCKETS:
+                for prompt_length in GENERATION_PROMPT_BUCKETS:
+                    self._generate_batch(["Hello"] * batch_size, prompt_length=prompt_length, max_new_tokens=2)
+            logger.info("✅ Text generation model compiled")
+        except Exception as e:
+            self._pad_to_buckets = False
+            self.text_generator.forward = eager_forward
+            logger.warning(f"⚠️ torch.compile unavailable, using eager text generation: {e}")
+    
+    def _warm_up_models(self):
+        """Run one pass through each model so the first user query sees steady-state latency"""
+        try:
+            start_time = time.perf_counter()
+            torch.backends.cudnn.benchmark = True
+            
+            self.qa_pipeline(question="warmup", context="warmup context")
+            
+            # A compiled generator was already warmed per bucket by _compile_text_generator
+            if not self._pad_to_buckets:
+                warmup_inputs = self.tokenizer("warmup", return_tensors="pt").input_ids.to(self.text_generator.device)
+                with torch.inference_mode():
+                    self.text_generator.generate(
+                        warmup_inputs,
+                        max_new_tokens=4,
+                        pad_token_id=self.tokenizer.pad_token_id
+                    )
+            
+            logger.info(f"🔥 Models warmed up in {time.perf_counter() - start_time:.2f}s")
+        except Exception as e:
+            logger.warning(f"⚠️ Model warm-up failed: {e}")
+    
+    def _start_generation_worker(self):
+        """Start the background thread that batches contextual-answer generation"""
+        self._generation_queue = queue.Queue()
+        worker = threading.Thread(target=self._generation_loop, name="text-generation-batcher", daemon=True)
+        worker.start()
+    
+    def _generation_loop(self):
+        """Collect prompts arriving within a short window and generate them as one batch"""
+        while True:
+            batch = [self._generation_queue.get()]
+            deadline = time.monotonic() + GENERATION_BATCH_WINDOW_SECONDS
+            while len(batch) < GENERATION_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._generation_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                generated_texts = self._generate_batch([prompt for prompt, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), generated_text in zip(batch, generated_texts):
+                future.set_result(generated_text)
+    
+    def _generate_batch(self, prompts: List[str], prompt_length: Optional[int] = None,
+                        max_new_tokens: int = CONTEXTUAL_MAX_NEW_TOKENS) -> List[str]:
+        """Tokenize and generate a padded batch of prompts in a single forward pass"""
+        max_prompt_length = GENERATION_PROMPT_BUCKETS[-1]
+        encoded = self.tokenizer(prompts, truncation=True, max_length=max_prompt_length)
+        
+        batch_size = len(prompts)
+        padding: Any = True
+        if self._pad_to_buckets:
+            # Filler rows repeat the first prompt and are dropped after decoding
+            batch_size = next(size for size in GENERATION_BATCH_BUCKETS if size >= len(prompts))
+            encoded = {key: values + [values[0]] * (batch_size - len(prompts)) for key, values in encoded.items()}
+            if prompt_length is None:
+                longest = max(len(ids) for ids in encoded['input_ids'])
+                prompt_length = next(size for size in GENERATION_PROMPT_BUCKETS if size >= longest)
+            padding = "max_length"
+        
+        # The model is placed once at load time (device_map="auto"); only the inputs move per call
+        inputs = self.tokenizer.pad(
+            encoded, padding=padding, max_length=prompt_length, return_tensors="pt"
+        ).to(self.text_generator.device)
+        
+        with torch.inference_mode():
+            outputs = self.text_generator.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                temperature=0.7,
+                do_sample=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id
+            )
+        
+        return self.tokenizer.batch_decode(outputs[:len(prompts)], skip_special_tokens=True)
+    
     def generate_answer(self, question: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Generate a direct answer to the question based on retrieved documents using local AI
@@ -76,22 +369,34 @@ class AnswerGenerationService:
                 }
             
             logger.info(f"🔍 Analyzing question: '{question}'")
-            logger.info(f"📄 Available documents: {[doc.get('filename', 'unknown') for doc in documents]}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"📄 Available documents: {[doc.get('filename', 'unknown') for doc in documents]}")
             
-            # Try AI-powered answer generation first
+            question_lower = question.lower()
+            categories = self._classify(question_lower)
+            
+            # Fast path: well-classified questions are answered by rules without a model forward pass
+            if categories:
+                rule_answer = self._analyze_and_answer(question_lower, documents, categories)
+                if rule_answer:
+                    return rule_answer
+            
+            # Try AI-powered answer generation next
             if settings.use_local_ai and self.qa_pipeline:
                 ai_answer = self._generate_ai_answer(question, documents)
                 if ai_answer:
                     return ai_answer
             
-            # Fallback to rule-based analysis for structured data
-            rule_answer = self._analyze_and_answer(question, documents)
-            if rule_answer:
-                return rule_answer
+            # Fallback to rule-based analysis across all handlers for unclassified questions
+            if not categories:
+                rule_answer = self._analyze_and_answer(question_lower, documents, categories)
+                if rule_answer:
+                    return rule_answer
             
             # Final fallback: use text generation for creative answering
             if settings.use_local_ai and self.text_generator:
-                generative_answer = self._generate_contextual_answer(question, documents)
+                generation_context = self._prepare_context_for_ai(documents, max_tokens=CONTEXTUAL_CONTEXT_TOKENS)
+                generative_answer = self._generate_contextual_answer(question, documents, generation_context)
                 if generative_answer:
                     return generative_answer
             
@@ -114,28 +419,33 @@ class AnswerGenerationService:
         try:
             logger.info("🤖 Using local AI for answer generation")
             
-            # Combine relevant document content
-            combined_context = self._prepare_context_for_ai(documents)
-            
-            if not combined_context.strip():
+            # One QA input per document so scores and sources are exact
+            candidates = [doc for doc in documents if doc.get('content', '').strip()]
+            if not candidates:
                 return None
             
-            # Use Q&A pipeline for extractive answering
-            result = self.qa_pipeline(
-                question=question,
-                context=combined_context,
+            qa_inputs = [{"question": question, "context": doc['content']} for doc in candidates]
+            
+            # Use Q&A pipeline for extractive answering, batched across documents; the pipeline
+            # windows each full document and returns its best span over all windows
+            results = self.qa_pipeline(
+                qa_inputs,
                 max_answer_len=150,
+                max_seq_len=QA_MAX_SEQ_LEN,
+                doc_stride=QA_DOC_STRIDE,
                 handle_impossible_answer=True
             )
+            if isinstance(results, dict):
+                results = [results]
             
-            if result['score'] > 0.1:  # Confidence threshold
-                # Find which document the answer came from
-                source_doc = self._find_source_document(result['answer'], documents)
-                
+            best_index = max(range(len(results)), key=lambda i: results[i]['score'])
+            best = results[best_index]
+            
+            if best['score'] > 0.1:  # Confidence threshold
                 return {
-                    "answer": result['answer'],
-                    "source": source_doc.get('filename') if source_doc else documents[0].get('filename'),
-                    "confidence": result['score']
+                    "answer": best['answer'],
+                    "source": candidates[best_index].get('filename'),
+                    "confidence": best['score']
                 }
             
             return None
@@ -144,14 +454,13 @@ class AnswerGenerationService:
             logger.error(f"Error in AI answer generation: {e}")
             return None
     
-    def _generate_contextual_answer(self, question: str, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    def _generate_contextual_answer(self, question: str, documents: List[Dict[str, Any]],
+                                    context: str) -> Optional[Dict[str, Any]]:
         """Use text generation model for more creative, contextual answers"""
         try:
             logger.info("💭 Using text generation for contextual answer")
             
             # Prepare a prompt for the text generation model
-            context = self._prepare_context_for_ai(documents, max_length=500)
-            
             prompt = f"""Based on the following company information, please answer the question accurately and helpfully.
 
 Company Information:
@@ -160,25 +469,10 @@ Company Information:
 Question: {question}
 Answer:"""
             
-            # Tokenize and generate
-            inputs = self.tokenizer.encode(prompt, return_tensors="pt", max_length=512, truncation=True)
-            
-            if self.device == "cuda":
-                inputs = inputs.to(self.device)
-                self.text_generator = self.text_generator.to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.text_generator.generate(
-                    inputs,
-                    max_new_tokens=100,
-                    temperature=0.7,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id
-                )
-            
-            # Decode the generated text
-            generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            # Hand the prompt to the batching worker and wait for the decoded text
+            future: Future = Future()
+            self._generation_queue.put((prompt, future))
+            generated_text = future.result()
             
             # Extract just the answer part
             answer_start = generated_text.find("Answer:") + len("Answer:")
@@ -188,9 +482,10 @@ Answer:"""
             answer = answer.split('\n')[0].strip()  # Take first line only
             
             if len(answer) > 10:  # Reasonable answer length
+                source_doc = self._find_source_document(answer, documents)
                 return {
                     "answer": answer,
-                    "source": documents[0].get('filename'),
+                    "source": source_doc.get('filename'),
                     "method": "text_generation"
                 }
             
@@ -200,48 +495,56 @@ Answer:"""
             logger.error(f"Error in contextual answer generation: {e}")
             return None
     
-    def _prepare_context_for_ai(self, documents: List[Dict[str, Any]], max_length: int = 1000) -> str:
-        """Prepare document context for AI models with smart truncation"""
-        combined_text = ""
+    def _prepare_context_for_ai(self, documents: List[Dict[str, Any]], max_tokens: int = CONTEXTUAL_CONTEXT_TOKENS) -> str:
+        """Prepare document context for AI models, truncated to a token budget of the generation tokenizer"""
+        parts: List[str] = []
+        remaining_tokens = max_tokens
+        separator_tokens = len(self.tokenizer("\n\n", add_special_tokens=False)['input_ids'])
         
         for doc in documents:
             content = doc.get('content', '')
             filename = doc.get('filename', 'unknown')
             
             # Add document source info
-            doc_text = f"Document: {filename}\n{content}\n\n"
-            
-            if len(combined_text + doc_text) > max_length:
-                # Truncate to fit within limit
-                remaining_space = max_length - len(combined_text)
-                if remaining_space > 100:  # Only add if there's meaningful space
-                    truncated_content = content[:remaining_space-50] + "..."
-                    combined_text += f"Document: {filename}\n{truncated_content}\n\n"
+            header = f"Document: {filename}\n"
+            header_tokens = len(self.tokenizer(header, add_special_tokens=False)['input_ids'])
+            content_ids = self.tokenizer(content, add_special_tokens=False, truncation=False)['input_ids']
+            available_tokens = remaining_tokens - header_tokens - separator_tokens
+            
+            if len(content_ids) > available_tokens:
+                # Truncate to fit within the token budget
+                if available_tokens > 25:  # Only add if there's meaningful space
+                    truncated_content = self.tokenizer.decode(content_ids[:available_tokens], skip_special_tokens=True)
+                    parts.append(f"{header}{truncated_content}...\n\n")
                 break
             
-            combined_text += doc_text
+            parts.append(f"{header}{content}\n\n")
+            remaining_tokens = available_tokens - len(content_ids)
         
-        return combined_text.strip()
+        return "".join(parts).strip()
     
     def _find_source_document(self, answer: str, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         """Find which document likely contains the answer"""
+        answer_words = _WORD_RE.findall(answer.lower())
+        
         for doc in documents:
-            content = doc.get('content', '').lower()
-            answer_lower = answer.lower()
+            cache_key = _content_hash(doc.get('content', ''))
+            doc_tokens = self._cache_get(self._doc_token_cache, cache_key)
+            if doc_tokens is None:
+                doc_tokens = set(_WORD_RE.findall(_content_lower(doc)))
+                self._cache_put(self._doc_token_cache, cache_key, doc_tokens, DOC_TOKEN_CACHE_SIZE)
             
             # Check if key words from the answer appear in this document
-            answer_words = answer_lower.split()
-            matches = sum(1 for word in answer_words if word in content)
+            matches = sum(1 for word in answer_words if word in doc_tokens)
             
             if matches >= len(answer_words) * 0.5:  # At least 50% of words match
                 return doc
         
         return documents[0] if documents else None
       
-    def _analyze_and_answer(self, question: str, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    def _analyze_and_answer(self, question_lower: str, documents: List[Dict[str, Any]],
+                            categories: Set[int]) -> Optional[Dict[str, Any]]:
         """Intelligent question analysis and answer generation"""
-        question_lower = question.lower()
-        
         # Separate documents by type for targeted analysis
         csv_docs = [doc for doc in documents if doc.get('filename', '').endswith('.csv')]
         onboarding_docs = [doc for doc in documents if 'onboarding' in doc.get('filename', '').lower()]
@@ -251,11 +554,11 @@ Answer:"""
         logger.info(f"📊 Document breakdown - CSV: {len(csv_docs)}, Onboarding: {len(onboarding_docs)}, Policy: {len(policy_docs)}")
         
         # Route to appropriate handler based on question type
-        if self._is_data_question(question_lower):
+        if QUESTION_DATA in categories:
             return self._handle_data_questions(question_lower, csv_docs)
-        elif self._is_onboarding_question(question_lower):
+        elif QUESTION_ONBOARDING in categories:
             return self._handle_onboarding_questions(question_lower, onboarding_docs)
-        elif self._is_policy_question(question_lower):
+        elif QUESTION_POLICY in categories:
             return self._handle_policy_questions(question_lower, policy_docs)
         else:
             # Try all handlers if question type is unclear
@@ -266,25 +569,35 @@ Answer:"""
         
         return None
     
-    def _is_data_question(self, question: str) -> bool:
-        """Check if question is about numerical/analytical data"""
-        data_keywords = ['most', 'least', 'total', 'count', 'budget', 'department', 'employee', 'people', 
-                        'staff', 'performance', 'rating', 'largest', 'smallest', 'highest', 'lowest',
-                        'how many', 'which department', 'what department']
-        return any(keyword in question for keyword in data_keywords)
+    def _cache_get(self, cache: OrderedDict, key: Any) -> Any:
+        """Look up an LRU cache entry, marking it most recently used"""
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
     
-    def _is_onboarding_question(self, question: str) -> bool:
-        """Check if question is about onboarding/first day"""
-        onboarding_keywords = ['first day', 'onboard', 'new employee', 'orientation', 'checklist',
-                              'meet with', 'who should i', 'what should i', 'security badge', 
-                              'laptop', 'manager', 'office tour']
-        return any(keyword in question for keyword in onboarding_keywords)
+    def _cache_put(self, cache: OrderedDict, key: Any, value: Any, max_size: int):
+        """Insert an LRU cache entry, evicting the least recently used one when full"""
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            if len(cache) > max_size:
+                cache.popitem(last=False)
     
-    def _is_policy_question(self, question: str) -> bool:
-        """Check if question is about company policies"""
-        policy_keywords = ['vacation', 'time off', 'sick leave', 'holiday', 'policy', 'benefits',
-                          'days per year', 'request', 'approval']
-        return any(keyword in question for keyword in policy_keywords)
+    def _classify(self, question: str) -> Set[int]:
+        """Classify the question into data/onboarding/policy categories in a single scan"""
+        if USE_HYPERSCAN:
+            categories: Set[int] = set()
+            
+            def on_match(category_id, start, end, flags, context):
+                categories.add(category_id)
+            
+            with _CLASSIFIER_LOCK:
+                _CLASSIFIER_DB.scan(question.encode(), match_event_handler=on_match)
+            return categories
+        
+        return {category for category, (_, pattern) in _CATEGORY_PATTERNS.items() if pattern.search(question)}
     
     def _handle_data_questions(self, question: str, csv_docs: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         """Handle questions about numerical data from CSV files"""
@@ -294,16 +607,17 @@ Answer:"""
         logger.info("📈 Handling data question")
         
         # Parse CSV data
-        csv_data = self._parse_csv_data(csv_docs[0])
-        if not csv_data:
+        csv_summary = self._parse_csv_data(csv_docs[0])
+        if not csv_summary:
             return None
+        csv_data = csv_summary['rows']
         
         source_filename = csv_docs[0].get('filename')
         
         # Department with most people/employees
         if any(phrase in question for phrase in ['most people', 'most employees', 'largest department', 
                                                'biggest department', 'which department has the most']):
-            max_dept = max(csv_data, key=lambda x: int(x.get('Employee Count', 0)))
+            max_dept = csv_summary['max_emp']
             return {
                 "answer": f"The {max_dept['Department']} department has the most people with {max_dept['Employee Count']} employees.",
                 "source": source_filename
@@ -312,7 +626,7 @@ Answer:"""
         # Department with least people/employees
         if any(phrase in question for phrase in ['least people', 'least employees', 'smallest department', 
                                                'fewest employees']):
-            min_dept = min(csv_data, key=lambda x: int(x.get('Employee Count', 0)))
+            min_dept = csv_summary['min_emp']
             return {
                 "answer": f"The {min_dept['Department']} department has the least people with {min_dept['Employee Count']} employees.",
                 "source": source_filename
@@ -321,15 +635,14 @@ Answer:"""
         # Total employees across all departments
         if any(phrase in question for phrase in ['total employees', 'total people', 'how many employees',
                                                'total staff', 'all employees']):
-            total = sum(int(dept.get('Employee Count', 0)) for dept in csv_data)
+            total = csv_summary['total_emp']
             return {
                 "answer": f"There are {total} employees in total across all departments.",
                 "source": source_filename
             }
         
         # Specific department employee count
-        for dept_data in csv_data:
-            dept_name = dept_data['Department'].lower()
+        for dept_name, dept_data in csv_summary['by_dept_lower'].items():
             if dept_name in question and any(word in question for word in ['people', 'employees', 'staff', 'how many']):
                 return {
                     "answer": f"The {dept_data['Department']} department has {dept_data['Employee Count']} employees.",
@@ -339,8 +652,7 @@ Answer:"""
         # Budget questions
         if 'budget' in question:
             # Total budget for specific department
-            for dept_data in csv_data:
-                dept_name = dept_data['Department'].lower()
+            for dept_name, dept_data in csv_summary['by_dept_lower'].items():
                 if dept_name in question:
                     budget = int(dept_data.get('Budget 2024', 0))
                     return {
@@ -350,7 +662,7 @@ Answer:"""
             
             # Highest/lowest budget questions
             if any(word in question for word in ['highest', 'largest', 'most', 'biggest']):
-                max_budget_dept = max(csv_data, key=lambda x: int(x.get('Budget 2024', 0)))
+                max_budget_dept = csv_summary['max_budget']
                 budget = int(max_budget_dept['Budget 2024'])
                 return {
                     "answer": f"The {max_budget_dept['Department']} department has the highest budget of ${budget:,} for 2024.",
@@ -358,7 +670,7 @@ Answer:"""
                 }
             
             if any(word in question for word in ['lowest', 'smallest', 'least']):
-                min_budget_dept = min(csv_data, key=lambda x: int(x.get('Budget 2024', 0)))
+                min_budget_dept = csv_summary['min_budget']
                 budget = int(min_budget_dept['Budget 2024'])
                 return {
                     "answer": f"The {min_budget_dept['Department']} department has the lowest budget of ${budget:,} for 2024.",
@@ -367,7 +679,7 @@ Answer:"""
             
             # Total budget across all departments
             if any(phrase in question for phrase in ['total budget', 'all budget', 'company budget']):
-                total_budget = sum(int(dept.get('Budget 2024', 0)) for dept in csv_data)
+                total_budget = csv_summary['total_budget']
                 return {
                     "answer": f"The total company budget for 2024 is ${total_budget:,} across all departments.",
                     "source": source_filename
@@ -391,8 +703,7 @@ Answer:"""
                         }
             
             # Specific department performance
-            for dept_data in csv_data:
-                dept_name = dept_data['Department'].lower()
+            for dept_name, dept_data in csv_summary['by_dept_lower'].items():
                 if dept_name in question:
                     return {
                         "answer": f"The {dept_data['Department']} department has a {dept_data['Performance Rating']} performance rating.",
@@ -407,12 +718,12 @@ Answer:"""
             
         logger.info("👋 Handling onboarding question")
         
-        content = onboarding_docs[0].get('content', '')
+        content_lower = _content_lower(onboarding_docs[0])
         source_filename = onboarding_docs[0].get('filename')
         
         # Who should I meet questions
         if any(phrase in question for phrase in ['who should i meet', 'meet with', 'who do i meet', 'who to meet']):
-            if 'meet with your direct manager' in content.lower():
+            if 'meet with your direct manager' in content_lower:
                 return {
                     "answer": "You should meet with your direct manager on your first day.",
                     "source": source_filename
@@ -421,9 +732,9 @@ Answer:"""
         # First day checklist questions
         if any(phrase in question for phrase in ['first day', 'what should i do', 'checklist', 'first thing']):
             # Extract first day checklist items
-            checklist_match = re.search(r'## first day checklist\s*\n((?:- .+\n?)+)', content.lower(), re.MULTILINE)
+            checklist_match = _CHECKLIST_RE.search(content_lower)
             if checklist_match:
-                checklist_items = re.findall(r'- (.+)', checklist_match.group(1))
+                checklist_items = _CHECKLIST_ITEM_RE.findall(checklist_match.group(1))
                 if checklist_items:
                     first_item = checklist_items[0].strip()
                     if 'first thing' in question or 'what should i do first' in question:
@@ -440,17 +751,17 @@ Answer:"""
         
         # HR/Orientation time questions
         if any(word in question for word in ['hr', 'orientation', 'report', 'time', 'when']):
-            time_match = re.search(r'report to hr at (\d+:\d+\s*[ap]m)', content.lower())
+            time_match = _HR_TIME_RE.search(content_lower)
             if time_match:
-                time = time_match.group(1)
+                hr_time = time_match.group(1)
                 return {
-                    "answer": f"Report to HR at {time} for orientation.",
+                    "answer": f"Report to HR at {hr_time} for orientation.",
                     "source": source_filename
                 }
         
         # Security badge questions
         if any(phrase in question for phrase in ['security badge', 'badge', 'id card']):
-            if 'security badge' in content.lower():
+            if 'security badge' in content_lower:
                 return {
                     "answer": "You will receive your security badge during the office tour on your first day.",
                     "source": source_filename
@@ -458,7 +769,7 @@ Answer:"""
         
         # Laptop/equipment questions
         if any(word in question for word in ['laptop', 'computer', 'equipment', 'credentials']):
-            if 'company laptop' in content.lower():
+            if 'company laptop' in content_lower:
                 return {
                     "answer": "You will receive your company laptop and access credentials on your first day.",
                     "source": source_filename
@@ -466,7 +777,7 @@ Answer:"""
         
         # Training questions
         if any(word in question for word in ['training', 'mandatory', 'required']):
-            training_match = re.search(r'## training requirements\s*\n(.+?)(?=\n##|\Z)', content.lower(), re.DOTALL)
+            training_match = _TRAINING_RE.search(content_lower)
             if training_match:
                 return {
                     "answer": "All new employees must complete Information Security training, Workplace Safety training, Company Culture session, and role-specific technical training.",
@@ -483,6 +794,7 @@ Answer:"""
         logger.info("📋 Handling policy question")
         
         content = policy_docs[0].get('content', '')
+        content_lower = _content_lower(policy_docs[0])
         source_filename = policy_docs[0].get('filename')
         
         # Vacation days entitlement
@@ -495,7 +807,7 @@ Answer:"""
                     }
             
             # Extract vacation entitlement info
-            entitlement_match = re.search(r'## vacation entitlement\s*\n((?:- .+\n?)+)', content.lower(), re.MULTILINE)
+            entitlement_match = _ENTITLEMENT_RE.search(content_lower)
             if entitlement_match:
                 return {
                     "answer": "Vacation entitlement varies by tenure: New employees get 15 days, 2+ years get 20 days, 5+ years get 25 days, and 10+ years get 30 days per year.",
@@ -504,7 +816,7 @@ Answer:"""
         
         # How to request vacation
         if any(phrase in question for phrase in ['how to request', 'request vacation', 'request time off', 'how do i request']):
-            if 'hr portal' in content.lower():
+            if 'hr portal' in content_lower:
                 return {
                     "answer": "Submit vacation requests through the HR portal at least 2 weeks in advance and get approval from your direct manager.",
                     "source": source_filename
@@ -527,12 +839,48 @@ Answer:"""
         
         return None
     
-    def _parse_csv_data(self, csv_doc: Dict[str, Any]) -> List[Dict[str, str]]:
-        """Parse CSV content into structured data"""
+    def _parse_csv_data(self, csv_doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Parse CSV content into structured rows plus precomputed aggregates (cached per document)"""
         try:
             content = csv_doc.get('content', '')
-            csv_reader = csv.DictReader(StringIO(content))
-            return list(csv_reader)
+            cache_key = _content_hash(content)
+            cached = self._cache_get(self._csv_cache, cache_key)
+            if cached is not None:
+                return cached
+            
+            # Project only the columns the handlers read; text columns stay strings
+            df = pd.read_csv(
+                StringIO(content),
+                usecols=lambda column: column in CSV_TEXT_COLUMNS or column in CSV_INT_COLUMNS,
+                keep_default_na=False,
+                dtype={column: str for column in CSV_TEXT_COLUMNS}
+            )
+            if df.empty:
+                return None
+            
+            # Numeric columns become contiguous int arrays; missing columns/values count as 0
+            for column in CSV_INT_COLUMNS:
+                if column in df:
+                    df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(int)
+                else:
+                    df[column] = 0
+            
+            rows = df.to_dict('records')
+            employee_counts = df['Employee Count']
+            budgets = df['Budget 2024']
+            summary = {
+                'df': df,
+                'rows': rows,
+                'max_emp': rows[employee_counts.idxmax()],
+                'min_emp': rows[employee_counts.idxmin()],
+                'total_emp': int(employee_counts.sum()),
+                'max_budget': rows[budgets.idxmax()],
+                'min_budget': rows[budgets.idxmin()],
+                'total_budget': int(budgets.sum()),
+                'by_dept_lower': {row['Department'].lower(): row for row in rows}
+            }
+            self._cache_put(self._csv_cache, cache_key, summary, CSV_CACHE_SIZE)
+            return summary
         except Exception as e:
             logger.error(f"Error parsing CSV data: {e}")
-            return []
+            return None
@@ -3,61 +3,241 @@ AI-Powered Answer Generation Service for QuerySense
 Uses advanced language models to generate human-like, accurate answers
 from any document format and structure
 """
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple, AsyncIterator
 import re
 import json
 import os
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
-import requests
-from transformers import pipeline, AutoTokenizer, AutoModelForQuestionAnswering
+from io import StringIO
+import httpx
+import pandas as pd
+from transformers import AutoTokenizer, AutoModelForQuestionAnswering
 import torch
 
+try:
+    import openai
+except ImportError:
+    openai = None
+
 logger = logging.getLogger(__name__)
 
+# Batched extractive QA settings
+QA_MODEL = "distilbert-base-cased-distilled-squad"
+QA_MAX_LENGTH = 384
+QA_MAX_QUESTION_TOKENS = 64
+QA_MAX_ANSWER_TOKENS = 15
+# CPU fallback threading: intra-op threads for the GEMMs, few inter-op threads for a single model
+CPU_MAX_THREADS = 16
+CPU_INTEROP_THREADS = 2
+
+# Long contexts are split into overlapping windows (doc stride) instead of being truncated
+QA_DOC_STRIDE = 128
+QA_MAX_WINDOWS = 16
+QA_BATCH_SIZE = 16
+QA_BATCH_WINDOW_SECONDS = 0.015
+# Row counts the compiled QA model is captured for; a batch is padded up to the next bucket
+# (and split beyond the largest) so torch.compile never sees a new batch shape at request time
+QA_ROW_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# Question keyword -> category tags used by source selection, enhancement and pattern answers
+QUESTION_TAG_KEYWORDS = {
+    'analytics': ['most', 'least', 'total', 'count', 'budget'],
+    'csv': ['department', 'employee', 'budget', 'most', 'total'],
+    'onboarding': ['first day', 'onboarding', 'new employee'],
+    'first_day': ['first day', 'meet with', 'who should i'],
+    'policy': ['vacation', 'time off', 'policy'],
+    'vacation': ['vacation', 'time off'],
+}
+_KEYWORD_TAGS: Dict[str, frozenset] = {}
+for _tag, _keywords in QUESTION_TAG_KEYWORDS.items():
+    for _keyword in _keywords:
+        _KEYWORD_TAGS[_keyword] = _KEYWORD_TAGS.get(_keyword, frozenset()) | {_tag}
+
+# Tags whose questions are answered from structured data / regex before running the QA model
+PATTERN_FIRST_TAGS = frozenset({'analytics', 'csv', 'vacation'})
+
+# All tag keywords compiled into one Aho-Corasick automaton (optional dependency)
+try:
+    import ahocorasick
+    _QUESTION_AUTOMATON = ahocorasick.Automaton()
+    for _keyword, _tags in _KEYWORD_TAGS.items():
+        _QUESTION_AUTOMATON.add_word(_keyword, _tags)
+    _QUESTION_AUTOMATON.make_automaton()
+    USE_AHOCORASICK = True
+except Exception:
+    _QUESTION_AUTOMATON = None
+    USE_AHOCORASICK = False
+
+# OpenAI prompt: the invariant instructions and document context come first so the
+# server-side prompt cache can reuse the shared prefix; the question goes last
+OPENAI_SYSTEM_PROMPT = """You are a helpful AI assistant for a company's internal knowledge system. Answer the user's question based on the provided company documents. Be accurate, concise, and helpful.
+
+Instructions:
+- Provide a direct, accurate answer based on the documents
+- If you need to analyze data, be specific with numbers and departments
+- If information is missing, clearly state what additional info is needed
+- Always cite which document your answer came from
+- Be conversational and human-like in your response"""
+
+# LRU sizes for answers keyed by (question, docset) and contexts keyed by docset
+ANSWER_CACHE_SIZE = 1024
+CONTEXT_CACHE_SIZE = 256
+
+# Single-pass content markers: one alternation per document type, dispatched on the matched group
+_GUIDE_MARKERS_RE = re.compile(
+    r'(?P<step>\d+[\.\)])(?=.)'
+    r'|(?P<checklist>checklist|todo|action items?)'
+    r'|(?P<meet>meet with|contact|speak to)'
+    r'|(?P<bring>bring|required|need)',
+    re.IGNORECASE
+)
+_GUIDE_PREFIXES = {'step': 'Step ', 'checklist': '📋 ', 'meet': '👥 ', 'bring': '📝 '}
+
+_POLICY_MARKERS_RE = re.compile(
+    r'(?P<days>\d+\s*days?)'
+    r'|(?P<rule>must|required|mandatory)'
+    r'|(?P<allowed>allowed|permitted|can)',
+    re.IGNORECASE
+)
+_POLICY_PREFIXES = {'days': '⏰ ', 'rule': '⚠️ ', 'allowed': '✅ '}
+
+def _content_hash(content: str) -> str:
+    """128-bit digest of document content (cache keys must change whenever any byte changes)"""
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+def _lowered_field(doc: Dict[str, Any], field: str) -> str:
+    """Return doc[field].lower(), computed once and stashed on the doc dict as '_<field>_lower'"""
+    key = f'_{field}_lower'
+    value = doc.get(key)
+    if value is None:
+        value = doc.get(field, '').lower()
+        doc[key] = value
+    return value
+
 class AIAnswerGenerationService:
     """Advanced AI service to generate human-like answers from any document type"""
     
     def __init__(self, device: str = "cuda"):
         self.device = device if torch.cuda.is_available() else "cpu"
-        self.qa_pipeline = None
-        self.text_generator = None
+        self.model = None
+        self.tokenizer = None
+        # Half precision on GPU (bf16 where supported), full precision / INT8 on CPU
+        self.dtype = torch.float32
+        # Compiled models see a fixed sequence length so the graph is captured once
+        self._pad_to_max_length = False
+        # Pending (question, context, future) triples consumed by the QA batching worker
+        self._qa_queue: Optional[queue.Queue] = None
+        self._answer_cache: OrderedDict = OrderedDict()
+        self._context_cache: OrderedDict = OrderedDict()
+        self._context_token_cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         self.use_local_model = not self.openai_api_key
+        self._openai = None
         
     def initialize(self):
         """Initialize AI models for answer generation"""
         try:
             logger.info("🧠 Initializing AI answer generation service...")
             
+            if not self.use_local_model and openai is None:
+                logger.warning("⚠️ OPENAI_API_KEY is set but the openai package is not installed, using local models")
+                self.use_local_model = True
+            
             if self.use_local_model:
                 logger.info("🤖 Loading local AI models...")
                 
-                # Load question-answering model
-                self.qa_pipeline = pipeline(
-                    "question-answering",
-                    model="distilbert-base-cased-distilled-squad",
-                    device=0 if self.device == "cuda" else -1
-                )
+                # Load question-answering model; batched QA calls it directly with padded tensors
+                self.tokenizer = AutoTokenizer.from_pretrained(QA_MODEL)
+                self.tokenizer.padding_side = "right"
+                self.model = self._load_qa_model()
                 
-                # Load text generation model for more complex reasoning
-                self.text_generator = pipeline(
-                    "text-generation",
-                    model="microsoft/DialoGPT-medium",
-                    device=0 if self.device == "cuda" else -1
-                )
+                if self.device == "cuda":
+                    self.dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+                    self.model = self.model.to(self.device, dtype=self.dtype)
+                else:
+                    self._configure_cpu_threads()
+                    # INT8 dynamic quantization of the Linear layers for CPU inference
+                    self.model = torch.quantization.quantize_dynamic(
+                        self.model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                
+                if self.device == "cuda":
+                    self._compile_qa_model()
+                
+                self._start_qa_worker()
                 
                 logger.info("✅ Local AI models loaded successfully")
             else:
                 logger.info("🌐 Using OpenAI API for answer generation")
                 
+                # One async client with a pooled keep-alive HTTP connection set for all requests
+                self._openai = openai.AsyncOpenAI(
+                    api_key=self.openai_api_key,
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+                    )
+                )
+                
             return True
             
         except Exception as e:
             logger.error(f"❌ Failed to initialize AI models: {e}")
             return False
     
-    def generate_answer(self, question: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _configure_cpu_threads(self):
+        """Size the CPU thread pools explicitly and enable oneDNN (servers often default to one thread)"""
+        torch.set_num_threads(min(os.cpu_count() or 1, CPU_MAX_THREADS))
+        try:
+            torch.set_num_interop_threads(CPU_INTEROP_THREADS)
+        except RuntimeError:
+            # Can only be set before inter-op parallel work has started
+            pass
+        torch.backends.mkldnn.enabled = True
+        logger.info(f"🧵 CPU inference using {torch.get_num_threads()} threads")
+    
+    def _load_qa_model(self):
+        """Load QA weights from memory-mapped safetensors so worker processes share the page cache"""
+        try:
+            # Meta-device init + assign: no random-init copy, tensors come straight from the mmap'd file
+            model = AutoModelForQuestionAnswering.from_pretrained(
+                QA_MODEL, use_safetensors=True, low_cpu_mem_usage=True
+            )
+        except (OSError, EnvironmentError) as e:
+            logger.warning(f"⚠️ No safetensors checkpoint for {QA_MODEL}, loading default weights: {e}")
+            model = AutoModelForQuestionAnswering.from_pretrained(QA_MODEL, low_cpu_mem_usage=True)
+        return model.eval()
+    
+    def _compile_qa_model(self):
+        """Compile the QA model with torch.compile and trigger compilation before the first request"""
+        eager_model = self.model
+        try:
+            logger.info("⚙️ Compiling QA model (reduce-overhead)...")
+            self.model = torch.compile(self.model, mode="reduce-overhead", dynamic=False)
+            
+            # Two warm-up forwards per row bucket: the first compiles, the second records the CUDA graph
+            with torch.inference_mode():
+                for rows in QA_ROW_BUCKETS:
+                    warmup_ids = torch.full((rows, QA_MAX_LENGTH), self.tokenizer.pad_token_id, dtype=torch.long, device=self.device)
+                    warmup_mask = torch.ones_like(warmup_ids)
+                    for _ in range(2):
+                        self.model(input_ids=warmup_ids, attention_mask=warmup_mask)
+            
+            self._pad_to_max_length = True
+            logger.info("✅ QA model compiled")
+        except Exception as e:
+            self.model = eager_model
+            logger.warning(f"⚠️ torch.compile unavailable, using eager QA model: {e}")
+    
+    async def generate_answer(self, question: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Generate intelligent, context-aware answers using AI
         """
@@ -71,24 +251,44 @@ class AIAnswerGenerationService:
             logger.info(f"🔍 AI analyzing question: '{question}'")
             logger.info(f"📄 Processing {len(documents)} documents")
             
-            # Prepare context from all documents
-            context = self._prepare_context(documents)
+            question_tags = self._question_tags(question)
+            docset_hash = self._docset_hash(documents)
+            answer_key = (question, docset_hash)
+            cached_answer = self._cache_get(self._answer_cache, answer_key)
+            if cached_answer is not None:
+                logger.info("⚡ Returning cached answer")
+                return dict(cached_answer)
+            
+            # Structured-data and vacation-days questions skip the model when a pattern answers them
+            if self.use_local_model:
+                answer_result = self._pattern_first_answer(question, documents, question_tags)
+                if answer_result:
+                    logger.info(f"⚡ Pattern answer: {answer_result['answer'][:100]}...")
+                    self._cache_put(self._answer_cache, answer_key, dict(answer_result), ANSWER_CACHE_SIZE)
+                    return answer_result
+            
+            # Prepare context from all documents (question-independent, cached per docset)
+            context = self._docset_context(docset_hash, documents)
             
             # Generate answer using AI
             if self.openai_api_key and not self.use_local_model:
-                answer_result = self._generate_openai_answer(question, context, documents)
+                answer_result = await self._generate_openai_answer(question, context, documents, question_tags)
             else:
-                answer_result = self._generate_local_answer(question, context, documents)
+                answer_result = await self._generate_local_answer(
+                    question, self._encode_context(docset_hash, context), documents, question_tags
+                )
             
             if answer_result:
                 logger.info(f"✅ AI generated answer: {answer_result['answer'][:100]}...")
-                return answer_result
+                self._cache_put(self._answer_cache, answer_key, dict(answer_result), ANSWER_CACHE_SIZE)
+            else:
+                # Fallback response (not cached: it may stem from a transient API or model error)
+                answer_result = {
+                    "answer": "I found relevant information but need more context to provide a specific answer. Could you please rephrase your question or provide more details?",
+                    "source": documents[0].get('filename') if documents else None
+                }
             
-            # Fallback response
-            return {
-                "answer": "I found relevant information but need more context to provide a specific answer. Could you please rephrase your question or provide more details?",
-                "source": documents[0].get('filename') if documents else None
-            }
+            return answer_result
             
         except Exception as e:
             logger.error(f"Error in AI answer generation: {e}")
@@ -97,107 +297,327 @@ class AIAnswerGenerationService:
                 "source": None
             }
     
+    async def stream_answer(self, question: str, documents: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """Yield the answer as it is generated: token by token from OpenAI, in one piece otherwise"""
+        if documents and self.openai_api_key and not self.use_local_model:
+            docset_hash = self._docset_hash(documents)
+            answer_key = (question, docset_hash)
+            cached_answer = self._cache_get(self._answer_cache, answer_key)
+            if cached_answer is not None:
+                yield cached_answer['answer']
+                return
+            
+            answer_parts = []
+            try:
+                async for token in self.stream_openai_answer(question, self._docset_context(docset_hash, documents)):
+                    answer_parts.append(token)
+                    yield token
+            except Exception as e:
+                logger.error(f"OpenAI streaming error: {e}")
+                if answer_parts:
+                    return
+            else:
+                source = self._determine_source_document(self._question_tags(question), documents)
+                answer_result = {"answer": "".join(answer_parts).strip(), "source": source}
+                self._cache_put(self._answer_cache, answer_key, answer_result, ANSWER_CACHE_SIZE)
+                return
+        
+        answer_result = await self.generate_answer(question, documents)
+        yield answer_result['answer']
+    
+    def _question_tags(self, question: str) -> Set[str]:
+        """Tag the question with keyword categories in a single pass over the lowered text"""
+        question_lower = question.lower()
+        if USE_AHOCORASICK:
+            return {tag for _, tags in _QUESTION_AUTOMATON.iter(question_lower) for tag in tags}
+        return {tag for keyword, tags in _KEYWORD_TAGS.items() if keyword in question_lower for tag in tags}
+    
+    def _pattern_first_answer(self, question: str, documents: List[Dict[str, Any]],
+                              question_tags: Set[str]) -> Optional[Dict[str, Any]]:
+        """Answer known-shape questions (CSV analytics, vacation days) by pattern matching, or return None"""
+        if 'vacation' in question_tags:
+            return self._pattern_based_answer(question, documents, question_tags)
+        if question_tags & PATTERN_FIRST_TAGS and any(doc.get('filename', '').endswith('.csv') for doc in documents):
+            return self._pattern_based_answer(question, documents, question_tags)
+        return None
+    
+    def _docset_hash(self, documents: List[Dict[str, Any]]) -> str:
+        """Order-independent fingerprint of a document set (filenames and full content)"""
+        fingerprints = sorted(f"{doc.get('filename', '')}:{_content_hash(doc.get('content', ''))}" for doc in documents)
+        return hashlib.blake2b("\n".join(fingerprints).encode(), digest_size=16).hexdigest()
+    
+    def _docset_context(self, docset_hash: str, documents: List[Dict[str, Any]]) -> str:
+        """Model context for a document set, prepared once per docset"""
+        context = self._cache_get(self._context_cache, docset_hash)
+        if context is None:
+            context = self._prepare_context(documents)
+            self._cache_put(self._context_cache, docset_hash, context, CONTEXT_CACHE_SIZE)
+        return context
+    
+    def _cache_get(self, cache: OrderedDict, key: Any) -> Any:
+        """Look up an LRU cache entry, marking it most recently used"""
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def _cache_put(self, cache: OrderedDict, key: Any, value: Any, max_size: int):
+        """Insert an LRU cache entry, evicting the least recently used one when full"""
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            if len(cache) > max_size:
+                cache.popitem(last=False)
+    
+    def _start_qa_worker(self):
+        """Start the background thread that coalesces concurrent QA requests into batches"""
+        self._qa_queue = queue.Queue()
+        worker = threading.Thread(target=self._qa_loop, name="qa-batcher", daemon=True)
+        worker.start()
+    
+    def _qa_loop(self):
+        """Collect QA requests arriving within a short window and answer them in one forward pass"""
+        while True:
+            batch = [self._qa_queue.get()]
+            deadline = time.monotonic() + QA_BATCH_WINDOW_SECONDS
+            while len(batch) < QA_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._qa_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                results = self._run_qa_batch([q for q, _, _ in batch], [c for _, c, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+    
+    async def _answer_question(self, question: str, encoded_context: Dict[str, Any]) -> Dict[str, Any]:
+        """Submit a single QA request to the batching worker and await its result"""
+        future: Future = Future()
+        self._qa_queue.put((question, encoded_context, future))
+        return await asyncio.wrap_future(future)
+    
+    def _encode_context(self, docset_hash: str, context: str) -> Dict[str, Any]:
+        """Tokenize a prepared context once per docset and cache its ids and character offsets"""
+        encoded = self._cache_get(self._context_token_cache, docset_hash)
+        if encoded is None:
+            encoding = self.tokenizer(context, add_special_tokens=False, return_offsets_mapping=True)
+            encoded = {
+                "text": context,
+                "input_ids": encoding["input_ids"],
+                "offsets": encoding["offset_mapping"]
+            }
+            self._cache_put(self._context_token_cache, docset_hash, encoded, CONTEXT_CACHE_SIZE)
+        return encoded
+    
+    def _run_qa_batch(self, questions: List[str], encoded_contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run extractive QA for (question, pre-tokenized context) pairs in a single padded forward pass"""
+        # Assemble [CLS] question [SEP] window [SEP] rows from cached context ids, sliding overlapping
+        # windows over the whole context so every window of every question shares one forward pass
+        rows = []
+        for pair_index, (question, encoded) in enumerate(zip(questions, encoded_contexts)):
+            question_ids = self.tokenizer(question, add_special_tokens=False)["input_ids"][:QA_MAX_QUESTION_TOKENS]
+            window_len = QA_MAX_LENGTH - len(question_ids) - 3
+            context_ids = encoded["input_ids"]
+            window_starts = range(0, max(len(context_ids) - QA_DOC_STRIDE, 1), window_len - QA_DOC_STRIDE)
+            for window_start in list(window_starts)[:QA_MAX_WINDOWS]:
+                window_ids = context_ids[window_start:window_start + window_len]
+                input_ids = [self.tokenizer.cls_token_id, *question_ids, self.tokenizer.sep_token_id,
+                             *window_ids, self.tokenizer.sep_token_id]
+                rows.append((input_ids, len(question_ids) + 2, len(window_ids), pair_index, window_start))
+        
+        # Sort by length so similarly sized pairs share a batch with minimal padding
+        order = sorted(range(len(rows)), key=lambda i: len(rows[i][0]))
+        max_len = QA_MAX_LENGTH if self._pad_to_max_length else max(len(row[0]) for row in rows)
+        input_ids = torch.full((len(rows), max_len), self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), max_len), dtype=torch.long)
+        context_mask = torch.zeros((len(rows), max_len), dtype=torch.bool)
+        for row, original_index in enumerate(order):
+            ids, context_start, context_len, _, _ = rows[original_index]
+            input_ids[row, :len(ids)] = torch.tensor(ids)
+            attention_mask[row, :len(ids)] = 1
+            context_mask[row, context_start:context_start + context_len] = True
+        
+        with torch.inference_mode():
+            start_logits, end_logits = self._qa_logits(input_ids, attention_mask)
+            context_mask = context_mask.to(self.device)
+            
+            # Only context tokens can be part of an answer span
+            start_logits = start_logits.float().masked_fill(~context_mask, float("-inf"))
+            end_logits = end_logits.float().masked_fill(~context_mask, float("-inf"))
+            start_probs = torch.softmax(start_logits, dim=1)
+            end_probs = torch.softmax(end_logits, dim=1)
+            
+            # Score every (start, end) pair with start <= end < start + max answer length
+            span_scores = torch.nan_to_num(start_probs.unsqueeze(2) * end_probs.unsqueeze(1))
+            span_scores = torch.triu(span_scores) - torch.triu(span_scores, diagonal=QA_MAX_ANSWER_TOKENS)
+            best_scores, best_flat = span_scores.flatten(1).max(dim=1)
+            start_idx = (best_flat // max_len).tolist()
+            end_idx = (best_flat % max_len).tolist()
+            best_scores = best_scores.tolist()
+        
+        # Keep the best-scoring window for each question
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        for row, original_index in enumerate(order):
+            _, context_start, context_len, pair_index, window_start = rows[original_index]
+            if results[pair_index] is not None and results[pair_index]["score"] >= best_scores[row]:
+                continue
+            encoded = encoded_contexts[pair_index]
+            char_start = char_end = 0
+            if context_len:
+                char_start = encoded["offsets"][window_start + start_idx[row] - context_start][0]
+                char_end = encoded["offsets"][window_start + end_idx[row] - context_start][1]
+            results[pair_index] = {
+                "answer": encoded["text"][char_start:char_end],
+                "score": best_scores[row],
+                "start": char_start,
+                "end": char_end
+            }
+        return results
+    
+    def _qa_logits(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Start/end logits for a padded batch; compiled models only ever see the warmed-up row buckets"""
+        if not self._pad_to_max_length:
+            outputs = self.model(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device))
+            return outputs.start_logits, outputs.end_logits
+        
+        start_parts, end_parts = [], []
+        max_rows = QA_ROW_BUCKETS[-1]
+        for offset in range(0, len(input_ids), max_rows):
+            ids = input_ids[offset:offset + max_rows]
+            mask = attention_mask[offset:offset + max_rows]
+            rows = len(ids)
+            bucket = next(size for size in QA_ROW_BUCKETS if size >= rows)
+            if bucket > rows:
+                filler = torch.full((bucket - rows, ids.shape[1]), self.tokenizer.pad_token_id, dtype=torch.long)
+                ids = torch.cat([ids, filler])
+                mask = torch.cat([mask, torch.ones_like(filler)])
+            outputs = self.model(input_ids=ids.to(self.device), attention_mask=mask.to(self.device))
+            # CUDA-graph outputs are overwritten by the next replay of the same bucket, so copy them out
+            start_parts.append(outputs.start_logits[:rows].clone())
+            end_parts.append(outputs.end_logits[:rows].clone())
+        return torch.cat(start_parts), torch.cat(end_parts)
+    
+    def preprocess_document(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Tag the document type and store its processed content on the doc dict (done once per document)"""
+        if '_processed' in doc:
+            return doc
+        
+        filename = doc.get('filename', 'Unknown Document')
+        filename_lower = _lowered_field(doc, 'filename')
+        content = doc.get('content', '')
+        
+        # Process different document types intelligently
+        if filename.endswith('.csv'):
+            doc['_type'] = 'csv'
+            doc['_processed'] = self._process_csv_content(doc)
+        elif 'onboarding' in filename_lower or 'guide' in filename_lower:
+            doc['_type'] = 'guide'
+            doc['_processed'] = self._process_guide_content(content)
+        elif 'policy' in filename_lower or 'vacation' in filename_lower:
+            doc['_type'] = 'policy'
+            doc['_processed'] = self._process_policy_content(content)
+        else:
+            doc['_type'] = 'text'
+            doc['_processed'] = content
+        
+        return doc
+    
     def _prepare_context(self, documents: List[Dict[str, Any]]) -> str:
         """Prepare comprehensive context from all documents"""
-        context_parts = []
+        # Write straight into one buffer; no per-document f-strings or intermediate list
+        buffer = StringIO()
+        for i, doc in enumerate(documents):
+            buffer.write("\n\n--- " if i else "\n--- ")
+            buffer.write(doc.get('filename', 'Unknown Document'))
+            buffer.write(" ---\n")
+            buffer.write(self.preprocess_document(doc)['_processed'])
+        return buffer.getvalue()
+    
+    def _csv_frame(self, csv_doc: Dict[str, Any]) -> pd.DataFrame:
+        """Parse CSV content into a string-typed DataFrame, cached on the doc dict by content hash"""
+        content = csv_doc.get('content', '')
+        content_hash = _content_hash(content)
         
-        for doc in documents:
-            filename = doc.get('filename', 'Unknown Document')
-            content = doc.get('content', '')
-            
-            # Add document header
-            context_parts.append(f"\n--- {filename} ---")
-            
-            # Process different document types intelligently
-            if filename.endswith('.csv'):
-                processed_content = self._process_csv_content(content)
-            elif 'onboarding' in filename.lower() or 'guide' in filename.lower():
-                processed_content = self._process_guide_content(content)
-            elif 'policy' in filename.lower() or 'vacation' in filename.lower():
-                processed_content = self._process_policy_content(content)
-            else:
-                processed_content = content
-            
-            context_parts.append(processed_content)
+        if csv_doc.get('_csv_hash') != content_hash:
+            df = pd.read_csv(
+                StringIO(content),
+                dtype=str,
+                keep_default_na=False,
+                skipinitialspace=True,
+                on_bad_lines='skip'
+            )
+            df.columns = df.columns.str.strip()
+            csv_doc['_csv_df'] = df
+            csv_doc['_csv_hash'] = content_hash
         
-        return "\n".join(context_parts)
+        return csv_doc['_csv_df']
     
-    def _process_csv_content(self, content: str) -> str:
+    def _process_csv_content(self, csv_doc: Dict[str, Any]) -> str:
         """Process CSV content to make it more readable for AI"""
-        lines = content.strip().split('\n')
-        if len(lines) < 2:
+        content = csv_doc.get('content', '')
+        try:
+            df = self._csv_frame(csv_doc)
+        except Exception:
+            return content
+        if df.empty:
             return content
         
-        # Parse as structured data
-        header = lines[0].split(',')
-        rows = [line.split(',') for line in lines[1:]]
-        
-        # Create human-readable format
-        formatted_lines = [f"Data contains {len(rows)} records with fields: {', '.join(header)}"]
-        
-        for i, row in enumerate(rows):
-            if len(row) == len(header):
-                record_info = []
-                for j, value in enumerate(row):
-                    if j < len(header):
-                        record_info.append(f"{header[j]}: {value.strip()}")
-                formatted_lines.append(f"Record {i+1}: {', '.join(record_info)}")
+        # Create human-readable format, one templated string per record built column-wise
+        columns = list(df.columns)
+        labelled = [column + ": " + df[column].str.strip() for column in columns]
+        records = labelled[0].str.cat(labelled[1:], sep=", ") if len(labelled) > 1 else labelled[0]
+        record_numbers = pd.Series(range(1, len(df) + 1), index=df.index).astype(str)
         
-        return '\n'.join(formatted_lines)
+        header_line = f"Data contains {len(df)} records with fields: {', '.join(columns)}"
+        return header_line + '\n' + ("Record " + record_numbers + ": " + records).str.cat(sep='\n')
     
     def _process_guide_content(self, content: str) -> str:
         """Process guide/onboarding content with clear structure"""
         # Add clear markers for important information
-        processed = content
-        processed = re.sub(r'(\d+[\.\)])(.+)', r'Step \1\2', processed)
-        processed = re.sub(r'(checklist|todo|action items?)', r'📋 \1', processed, flags=re.IGNORECASE)
-        processed = re.sub(r'(meet with|contact|speak to)', r'👥 \1', processed, flags=re.IGNORECASE)
-        processed = re.sub(r'(bring|required|need)', r'📝 \1', processed, flags=re.IGNORECASE)
-        return processed
+        return _GUIDE_MARKERS_RE.sub(lambda m: _GUIDE_PREFIXES[m.lastgroup] + m.group(0), content)
     
     def _process_policy_content(self, content: str) -> str:
         """Process policy content with emphasis on key rules"""
-        processed = content
-        processed = re.sub(r'(\d+\s*days?)', r'⏰ \1', processed, flags=re.IGNORECASE)
-        processed = re.sub(r'(must|required|mandatory)', r'⚠️ \1', processed, flags=re.IGNORECASE)
-        processed = re.sub(r'(allowed|permitted|can)', r'✅ \1', processed, flags=re.IGNORECASE)
-        return processed
+        return _POLICY_MARKERS_RE.sub(lambda m: _POLICY_PREFIXES[m.lastgroup] + m.group(0), content)
     
-    def _generate_openai_answer(self, question: str, context: str, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    async def stream_openai_answer(self, question: str, context: str) -> AsyncIterator[str]:
+        """Stream answer tokens from the OpenAI API as they are generated"""
+        # System prompt + documents form a byte-identical prefix per docset, so the provider's
+        # prefix (KV) cache is reused across questions; only the final question message changes
+        stream = await self._openai.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Company Documents:\n{context}"},
+                {"role": "user", "content": f"User Question: {question}\n\nAnswer:"}
+            ],
+            max_tokens=300,
+            temperature=0.3,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def _generate_openai_answer(self, question: str, context: str, documents: List[Dict[str, Any]],
+                                      question_tags: Set[str]) -> Optional[Dict[str, Any]]:
         """Generate answer using OpenAI API"""
         try:
-            import openai
-            
-            prompt = f"""You are a helpful AI assistant for a company's internal knowledge system. Answer the user's question based on the provided company documents. Be accurate, concise, and helpful.
-
-Company Documents:
-{context}
-
-User Question: {question}
-
-Instructions:
-- Provide a direct, accurate answer based on the documents
-- If you need to analyze data, be specific with numbers and departments
-- If information is missing, clearly state what additional info is needed
-- Always cite which document your answer came from
-- Be conversational and human-like in your response
-
-Answer:"""
-
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant for company internal knowledge."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300,
-                temperature=0.3
-            )
-            
-            answer = response.choices[0].message.content.strip()
+            answer_parts = [token async for token in self.stream_openai_answer(question, context)]
+            answer = "".join(answer_parts).strip()
             
             # Determine best source document
-            source = self._determine_source_document(question, documents)
+            source = self._determine_source_document(question_tags, documents)
             
             return {
                 "answer": answer,
@@ -208,40 +628,44 @@ Answer:"""
             logger.error(f"OpenAI API error: {e}")
             return None
     
-    def _generate_local_answer(self, question: str, context: str, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    async def _generate_local_answer(self, question: str, encoded_context: Dict[str, Any],
+                               documents: List[Dict[str, Any]], question_tags: Set[str]) -> Optional[Dict[str, Any]]:
         """Generate answer using local AI models"""
         try:
-            # Use question-answering pipeline for direct answers
-            if len(context) > 4000:  # Truncate if too long
-                context = context[:4000] + "..."
+            # Use question-answering model for direct answers (batched with concurrent requests);
+            # the cached context tokens are covered by overlapping windows scored in the same batch
+            result = await self._answer_question(question, encoded_context)
+            return self._local_answer_from_result(question, result, documents, question_tags)
             
-            result = self.qa_pipeline(question=question, context=context)
+        except Exception as e:
+            logger.error(f"Local AI model error: {e}")
+            return self._pattern_based_answer(question, documents, question_tags)
+    
+    def _local_answer_from_result(self, question: str, result: Optional[Dict[str, Any]],
+                                  documents: List[Dict[str, Any]], question_tags: Set[str]) -> Optional[Dict[str, Any]]:
+        """Turn a QA model result into an answer, falling back to pattern matching on low confidence"""
+        if result and result['score'] > 0.1:  # Confidence threshold
+            answer = result['answer']
             
-            if result['score'] > 0.1:  # Confidence threshold
-                answer = result['answer']
-                
-                # Enhance answer with contextual information
-                enhanced_answer = self._enhance_answer(question, answer, documents)
-                
-                source = self._determine_source_document(question, documents)
-                
-                return {
-                    "answer": enhanced_answer,
-                    "source": source
-                }
+            # Enhance answer with contextual information
+            enhanced_answer = self._enhance_answer(question, answer, documents, question_tags)
             
-            # Fallback to pattern-based answering for structured data
-            return self._pattern_based_answer(question, documents)
+            source = self._determine_source_document(question_tags, documents)
             
-        except Exception as e:
-            logger.error(f"Local AI model error: {e}")
-            return self._pattern_based_answer(question, documents)
+            return {
+                "answer": enhanced_answer,
+                "source": source
+            }
+        
+        # Fallback to pattern-based answering for structured data
+        return self._pattern_based_answer(question, documents, question_tags)
     
-    def _enhance_answer(self, question: str, base_answer: str, documents: List[Dict[str, Any]]) -> str:
+    def _enhance_answer(self, question: str, base_answer: str, documents: List[Dict[str, Any]],
+                        question_tags: Set[str]) -> str:
         """Enhance the base answer with additional context and analysis"""
         
         # For data questions, try to add more analytical context
-        if any(word in question.lower() for word in ['most', 'least', 'total', 'count', 'budget']):
+        if 'analytics' in question_tags:
             csv_docs = [doc for doc in documents if doc.get('filename', '').endswith('.csv')]
             if csv_docs:
                 analysis = self._analyze_csv_data(question, csv_docs[0])
@@ -249,50 +673,58 @@ Answer:"""
                     return f"{base_answer}. {analysis}"
         
         # For policy questions, add practical guidance
-        if any(word in question.lower() for word in ['vacation', 'time off', 'policy']):
+        if 'policy' in question_tags:
             return f"{base_answer} Please check with HR if you need clarification on the specific procedures."
         
         # For onboarding questions, add helpful reminders
-        if any(word in question.lower() for word in ['first day', 'onboarding', 'new employee']):
+        if 'onboarding' in question_tags:
             return f"{base_answer} Don't forget to bring required documents and arrive a few minutes early."
         
         return base_answer
     
+    def _csv_columns(self, csv_doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Columnar NumPy arrays for the CSV's analytic fields, parsed once and cached on the doc dict"""
+        df = self._csv_frame(csv_doc)
+        columns = csv_doc.get('_np')
+        if columns is not None and columns['hash'] == csv_doc['_csv_hash']:
+            return columns
+        
+        count_field = 'Employee Count' if 'Employee Count' in df else ('Employees' if 'Employees' in df else None)
+        columns = {
+            'hash': csv_doc['_csv_hash'],
+            'rows': len(df),
+            'department': df['Department'].to_numpy() if 'Department' in df else None,
+            'count_field': count_field,
+            'employees': df[count_field].astype(int).to_numpy() if count_field else None,
+            'employee_count': df['Employee Count'].astype(int).to_numpy() if 'Employee Count' in df else None,
+            # Budget strings like "$2,500,000" cleaned to floats once
+            'budget': df['Budget'].str.replace(r'[$,]', '', regex=True).astype(float).to_numpy() if 'Budget' in df else None,
+        }
+        csv_doc['_np'] = columns
+        return columns
+    
     def _analyze_csv_data(self, question: str, csv_doc: Dict[str, Any]) -> Optional[str]:
         """Analyze CSV data to provide specific insights"""
         try:
-            content = csv_doc.get('content', '')
-            lines = content.strip().split('\n')
+            columns = self._csv_columns(csv_doc)
             
-            if len(lines) < 2:
-                return None
-            
-            header = [col.strip() for col in lines[0].split(',')]
-            rows = []
-            
-            for line in lines[1:]:
-                row_data = [col.strip() for col in line.split(',')]
-                if len(row_data) == len(header):
-                    row_dict = dict(zip(header, row_data))
-                    rows.append(row_dict)
-            
-            if not rows:
+            if not columns['rows']:
                 return None
             
             # Analyze based on question type
             if 'most people' in question or 'most employees' in question:
-                if 'Employee Count' in header or 'Employees' in header:
-                    count_field = 'Employee Count' if 'Employee Count' in header else 'Employees'
-                    max_dept = max(rows, key=lambda x: int(x.get(count_field, 0)))
-                    return f"Specifically, {max_dept.get('Department', 'this department')} has {max_dept.get(count_field)} employees."
+                if columns['employees'] is not None:
+                    max_index = columns['employees'].argmax()
+                    department = columns['department'][max_index] if columns['department'] is not None else 'this department'
+                    return f"Specifically, {department} has {columns['employees'][max_index]} employees."
             
             elif 'total' in question and ('budget' in question or 'employees' in question):
-                if 'Budget' in header:
-                    total_budget = sum(float(row.get('Budget', 0).replace('$', '').replace(',', '')) for row in rows)
+                if columns['budget'] is not None:
+                    total_budget = columns['budget'].sum()
                     return f"The total budget across all departments is ${total_budget:,.2f}."
-                elif 'Employee Count' in header:
-                    total_employees = sum(int(row.get('Employee Count', 0)) for row in rows)
-                    return f"There are {total_employees} total employees across {len(rows)} departments."
+                elif columns['employee_count'] is not None:
+                    total_employees = columns['employee_count'].sum()
+                    return f"There are {total_employees} total employees across {columns['rows']} departments."
             
             return None
             
@@ -300,13 +732,12 @@ Answer:"""
             logger.error(f"Error analyzing CSV data: {e}")
             return None
     
-    def _pattern_based_answer(self, question: str, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    def _pattern_based_answer(self, question: str, documents: List[Dict[str, Any]],
+                              question_tags: Set[str]) -> Optional[Dict[str, Any]]:
         """Fallback pattern-based answer generation"""
-        question_lower = question.lower()
-        
         # Look for CSV data questions
         csv_docs = [doc for doc in documents if doc.get('filename', '').endswith('.csv')]
-        if csv_docs and any(word in question_lower for word in ['department', 'employee', 'budget', 'most', 'total']):
+        if csv_docs and 'csv' in question_tags:
             result = self._analyze_csv_data(question, csv_docs[0])
             if result:
                 return {
@@ -316,10 +747,10 @@ Answer:"""
         
         # Look for specific information in text documents
         for doc in documents:
-            content = doc.get('content', '').lower()
+            content = _lowered_field(doc, 'content')
             
             # First day / onboarding questions
-            if any(phrase in question_lower for phrase in ['first day', 'meet with', 'who should i']):
+            if 'first_day' in question_tags:
                 if 'hr' in content and 'orientation' in content:
                     return {
                         "answer": "On your first day, you should report to HR for orientation. They will guide you through the onboarding process and introduce you to your team.",
@@ -327,7 +758,7 @@ Answer:"""
                     }
             
             # Vacation policy questions
-            if 'vacation' in question_lower or 'time off' in question_lower:
+            if 'vacation' in question_tags:
                 if 'vacation' in content or 'time off' in content:
                     # Try to extract specific numbers
                     days_match = re.search(r'(\d+)\s*days?', content)
@@ -340,23 +771,21 @@ Answer:"""
         
         return None
     
-    def _determine_source_document(self, question: str, documents: List[Dict[str, Any]]) -> Optional[str]:
+    def _determine_source_document(self, question_tags: Set[str], documents: List[Dict[str, Any]]) -> Optional[str]:
         """Determine which document is most likely to contain the answer"""
-        question_lower = question.lower()
-        
         # Prioritize based on question type
-        if any(word in question_lower for word in ['department', 'employee', 'budget', 'most', 'total']):
+        if 'csv' in question_tags:
             csv_docs = [doc for doc in documents if doc.get('filename', '').endswith('.csv')]
             if csv_docs:
                 return csv_docs[0].get('filename')
         
-        if any(word in question_lower for word in ['first day', 'onboarding', 'new employee']):
-            onboarding_docs = [doc for doc in documents if 'onboarding' in doc.get('filename', '').lower()]
+        if 'onboarding' in question_tags:
+            onboarding_docs = [doc for doc in documents if 'onboarding' in _lowered_field(doc, 'filename')]
             if onboarding_docs:
                 return onboarding_docs[0].get('filename')
         
-        if any(word in question_lower for word in ['vacation', 'policy', 'time off']):
-            policy_docs = [doc for doc in documents if any(word in doc.get('filename', '').lower() 
+        if 'policy' in question_tags:
+            policy_docs = [doc for doc in documents if any(word in _lowered_field(doc, 'filename') 
                           for word in ['policy', 'vacation'])]
             if policy_docs:
                 return policy_docs[0].get('filename')
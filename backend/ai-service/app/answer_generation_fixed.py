@@ -2,17 +2,264 @@
 Answer Generation Service for QuerySense
 Generates direct answers to user questions based on retrieved documents
 """
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache, partial
+from itertools import accumulate
+from typing import List, Dict, Any, Optional, Set, Tuple
 import re
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Question keyword -> intent tags, each keyword group gating one rule block
+INTENT_KEYWORDS = {
+    'employee': ['employee', 'staff', 'people', 'member', 'worker', 'many'],
+    'total': ['total', 'all', 'across'],
+    'budget': ['budget', 'cost', 'money'],
+    'performance': ['performance', 'rating', 'best', 'excellent'],
+    'best': ['best', 'excellent'],
+    'orientation': ['hr', 'orientation', 'report'],
+    'onboarding': ['first day', 'onboard', 'checklist', 'new employee'],
+    'largest': ['most people', 'most employees', 'largest department', 'biggest department'],
+    'badge': ['security badge', 'badge', 'id card'],
+    'meet': ['who should i meet', 'meet with', 'who do i meet'],
+    'process': ['process for new hires', 'hiring process', 'onboarding process'],
+    'first_thing': ['what should', 'what do', 'first thing'],
+}
+_KEYWORD_INTENTS: Dict[str, frozenset] = {}
+for _intent, _keywords in INTENT_KEYWORDS.items():
+    for _keyword in _keywords:
+        _KEYWORD_INTENTS[_keyword] = _KEYWORD_INTENTS.get(_keyword, frozenset()) | {_intent}
+
+# All intent keywords compiled into one Aho-Corasick automaton (optional dependency)
+try:
+    import ahocorasick
+    _INTENT_AUTOMATON = ahocorasick.Automaton()
+    for _keyword, _intents in _KEYWORD_INTENTS.items():
+        _INTENT_AUTOMATON.add_word(_keyword, _intents)
+    _INTENT_AUTOMATON.make_automaton()
+    USE_AHOCORASICK = True
+except Exception:
+    _INTENT_AUTOMATON = None
+    USE_AHOCORASICK = False
+
+# Rule patterns, compiled once at import and matched case-insensitively against the original content
+DEPARTMENTS = ("engineering", "sales", "marketing", "hr")
+DEPARTMENT_NAMES = {"engineering": "Engineering", "sales": "Sales", "marketing": "Marketing", "hr": "HR"}
+
+# One alternation pass per metric over "Department: X | ... | Metric: value" records
+_DEPT_EMPLOYEE_RE = re.compile(r"department:\s*(\w+)\s*\|\s*employee count:\s*(\d+)", re.IGNORECASE)
+_DEPT_BUDGET_RE = re.compile(r"department:\s*(\w+)[^\n]*?budget[^:\n]*:\s*\$?(\d+)", re.IGNORECASE)
+_RATING_RE = re.compile(r"department:\s*(\w+).*?performance rating:\s*(\w+)", re.IGNORECASE)
+# Every "Employee Count: N" occurrence, department record or not, counts toward the total
+_EMPLOYEE_COUNT_RE = re.compile(r"employee count:\s*(\d+)", re.IGNORECASE)
+
+# Answer-extraction patterns addressed by name; one Hyperscan scan tells which of them can match
+_CONTENT_PATTERNS: Dict[str, re.Pattern] = {
+    # Looser per-department fallbacks for content that is not in record format
+    **{f"employee_fallback:{dept}": re.compile(rf"{dept}.*?employee count:\s*(\d+)", re.IGNORECASE) for dept in DEPARTMENTS},
+    **{f"budget_fallback:{dept}": re.compile(rf"{dept}.*?budget.*?(\d+)", re.IGNORECASE) for dept in DEPARTMENTS},
+    "hr_time:report": re.compile(r"report to hr at (\d+:\d+\s*[ap]m)", re.IGNORECASE),
+    "hr_time:hr": re.compile(r"hr.*?(\d+:\d+\s*[ap]m)", re.IGNORECASE),
+    "hr_time:orientation": re.compile(r"orientation.*?(\d+:\d+\s*[ap]m)", re.IGNORECASE),
+    "checklist:first_item": re.compile(r"first day checklist.*?-\s*(.+?)(?:\n|$)", re.DOTALL | re.IGNORECASE),
+    "checklist:section": re.compile(r"## first day.*?\n.*?-\s*(.+?)(?:\n|$)", re.DOTALL | re.IGNORECASE),
+}
+# Plain phrase tests: lowercase byte needles searched with bytes.find; compiled into Hyperscan too
+_LITERAL_NEEDLES: Dict[str, bytes] = {
+    "security_badge": b"security badge",
+    "meet_manager": b"meet with your direct manager",
+    "checklist_heading": b"first day checklist",
+}
+_CONTENT_PATTERNS.update(
+    {name: re.compile(re.escape(needle.decode()), re.IGNORECASE) for name, needle in _LITERAL_NEEDLES.items()}
+)
+_HR_TIME_PATTERNS = ("hr_time:report", "hr_time:hr", "hr_time:orientation")
+_CHECKLIST_PATTERNS = ("checklist:first_item", "checklist:section")
+_CONTENT_PATTERN_NAMES = list(_CONTENT_PATTERNS)
+
+# Text-extraction intents: (content patterns tried in order, answer template over the match groups)
+EXTRACTION_RULES = {
+    'orientation': (_HR_TIME_PATTERNS, "Report to HR at {} for orientation."),
+    'onboarding': (_CHECKLIST_PATTERNS, "For the first day: {}"),
+    'badge': (("security_badge",), "You will get your security badge during the office tour on your first day."),
+    'meet': (("meet_manager",), "You should meet with your direct manager on your first day."),
+    'process': (("checklist_heading",), "The process includes: reporting to HR for orientation, completing paperwork, receiving laptop and credentials, meeting your manager, and getting an office tour."),
+    'first_thing': (("checklist:first_item",), "First thing to do: {}."),
+}
+
+# Intents answered from the parsed department table
+DEPARTMENT_INTENTS = frozenset({'employee', 'budget', 'performance', 'largest'})
+_EMPTY_DEPARTMENT_TABLE = {"departments": {}, "source": None, "total_employees": None}
+
+# Intents are tried in this priority order; the first rule that produces an answer wins
+RULE_ORDER = ('employee', 'budget', 'performance', 'orientation', 'onboarding', 'largest', 'badge', 'meet', 'process', 'first_thing')
+
+# All content patterns compiled into one Hyperscan database (optional dependency)
+try:
+    import hyperscan
+    _CONTENT_DB = hyperscan.Database()
+    _CONTENT_DB.compile(
+        expressions=[pattern.pattern.encode() for pattern in _CONTENT_PATTERNS.values()],
+        ids=list(range(len(_CONTENT_PATTERN_NAMES))),
+        elements=len(_CONTENT_PATTERN_NAMES),
+        flags=[
+            hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+            | (hyperscan.HS_FLAG_DOTALL if pattern.flags & re.DOTALL else 0)
+            for pattern in _CONTENT_PATTERNS.values()
+        ]
+    )
+    USE_HYPERSCAN = True
+except Exception:
+    _CONTENT_DB = None
+    USE_HYPERSCAN = False
+
+# Hyperscan scratch space is not thread-safe, so each thread allocates its own once
+_SCAN_LOCAL = threading.local()
+
+def _scan_documents(documents: List[Dict[str, Any]]):
+    """Scan every not-yet-scanned document in one block-mode Hyperscan call and stash its hits as '_content_hits'"""
+    pending = [doc for doc in documents if '_content_hits' not in doc]
+    if not pending:
+        return
+    if not USE_HYPERSCAN:
+        for doc in pending:
+            doc['_content_hits'] = None
+        return
+    
+    # One buffer with a newline after each document; a match is attributed to the document its end falls in.
+    # Matches straddling a boundary can only add hits, and every hit is confirmed by re on that document.
+    encoded = [doc.get('content', '').encode() + b"\n" for doc in pending]
+    starts = list(accumulate((len(chunk) for chunk in encoded[:-1]), initial=0))
+    hits: List[Set[str]] = [set() for _ in pending]
+    
+    def on_match(pattern_id, start, end, flags, context):
+        hits[bisect_right(starts, end - 1) - 1].add(_CONTENT_PATTERN_NAMES[pattern_id])
+    
+    scratch = getattr(_SCAN_LOCAL, 'scratch', None)
+    if scratch is None:
+        scratch = _SCAN_LOCAL.scratch = hyperscan.Scratch(_CONTENT_DB)
+    _CONTENT_DB.scan(b"".join(encoded), match_event_handler=on_match, scratch=scratch)
+    
+    for doc, doc_hits in zip(pending, hits):
+        doc['_content_hits'] = doc_hits
+
+def _content_hash(doc: Dict[str, Any]) -> str:
+    """Return a digest of the document's content, computed once and stashed on the doc dict"""
+    digest = doc.get('_content_hash')
+    if digest is None:
+        digest = hashlib.blake2b(doc.get('content', '').encode(), digest_size=16).hexdigest()
+        doc['_content_hash'] = digest
+    return digest
+
+def _content_bytes_lower(doc: Dict[str, Any]) -> bytes:
+    """Return the document's content as lowercased UTF-8 bytes, computed once and stashed on the doc dict"""
+    content_bytes = doc.get('_content_bytes_lower')
+    if content_bytes is None:
+        content_bytes = doc.get('content', '').encode().lower()
+        doc['_content_bytes_lower'] = content_bytes
+    return content_bytes
+
+def _first_match(scanned: List[tuple], names) -> tuple:
+    """First (doc, match groups) for the named patterns, trying each pattern across all documents in order"""
+    for name in names:
+        for doc, content, hits in scanned:
+            groups = _search(name, doc, content, hits)
+            if groups is not None:
+                return doc, groups
+    return None, None
+
+def _search(name: str, doc: Dict[str, Any], content: str, hits: Optional[Set[str]]) -> Optional[tuple]:
+    """Match groups of a named content pattern, or None; skipped outright when the Hyperscan pass found no match"""
+    if hits is not None and name not in hits:
+        return None
+    needle = _LITERAL_NEEDLES.get(name)
+    if needle is not None:
+        # Hyperscan hits are exact for literals; otherwise a memmem-backed bytes search
+        return () if hits is not None or _content_bytes_lower(doc).find(needle) != -1 else None
+    match = _CONTENT_PATTERNS[name].search(content)
+    return match.groups() if match else None
+
+def _department_metric_handler(dept: str, field: str, fallback_name: Optional[str], template: str, convert):
+    """Build the handler for one (metric, department) pair with its name, fallback pattern and wording baked in"""
+    display_name = DEPARTMENT_NAMES[dept]
+    fallback = (fallback_name,) if fallback_name else ()
+    
+    def handler(facts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        value = facts["departments"].get(dept, {}).get(field)
+        source = facts["department_source"]
+        if value is None and fallback:
+            doc, groups = _first_match(facts["scanned"], fallback)
+            if groups:
+                value, source = groups[0], doc.get('filename')
+        if value is None:
+            return None
+        return {"answer": template.format(name=display_name, value=convert(value)), "source": source}
+    
+    return handler
+
+# Specialized per-department handlers, built once at import: question department -> answer
+_EMPLOYEE_HANDLERS = {
+    dept: _department_metric_handler(dept, "employees", f"employee_fallback:{dept}",
+                                     "The {name} department has {value} employees.", int)
+    for dept in DEPARTMENTS
+}
+_BUDGET_HANDLERS = {
+    dept: _department_metric_handler(dept, "budget", f"budget_fallback:{dept}",
+                                     "The {name} department budget is ${value:,}.", int)
+    for dept in DEPARTMENTS
+}
+_RATING_HANDLERS = {
+    dept: _department_metric_handler(dept, "rating", None,
+                                     "The {name} department has a {value} performance rating.", str.title)
+    for dept in DEPARTMENTS
+}
+
+# Answers kept for recently asked (question, document set) pairs
+ANSWER_CACHE_SIZE = 1024
+
+# Parsed department tables kept for recently seen contents and document sets
+DEPARTMENT_PARSE_CACHE_SIZE = 128
+
+@lru_cache(maxsize=DEPARTMENT_PARSE_CACHE_SIZE)
+def _parse_departments(content: str) -> Dict[str, Dict[str, Any]]:
+    """Parse department records once into {department: {"employees": int, "budget": int, "rating": str}}"""
+    departments: Dict[str, Dict[str, Any]] = {}
+    # First occurrence wins, like re.search would
+    # Departments and ratings are keyed lowercase; matching itself is case-insensitive
+    for dept, count in _DEPT_EMPLOYEE_RE.findall(content):
+        departments.setdefault(dept.lower(), {}).setdefault("employees", int(count))
+    for dept, amount in _DEPT_BUDGET_RE.findall(content):
+        departments.setdefault(dept.lower(), {}).setdefault("budget", int(amount))
+    for dept, rating in _RATING_RE.findall(content):
+        departments.setdefault(dept.lower(), {}).setdefault("rating", rating.lower())
+    return departments
+
+@lru_cache(maxsize=DEPARTMENT_PARSE_CACHE_SIZE)
+def _employee_counts(content: str) -> Tuple[int, ...]:
+    """All employee counts in the content, in order (duplicates and non-record lines included)"""
+    return tuple(int(count) for count in _EMPLOYEE_COUNT_RE.findall(content))
+
 class AnswerGenerationService:
     """Service to generate answers from retrieved documents"""
     
     def __init__(self, device: str = "cuda"):
         self.device = device
+        self._answer_cache: OrderedDict = OrderedDict()
+        # Merged department tables and aggregates keyed by the ordered (filename, digest) document set
+        self._department_tables: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Intent -> rule handler, resolved once instead of walking an if-chain per question
+        self._rule_handlers = {
+            'employee': self._employee_rule,
+            'budget': self._budget_rule,
+            'performance': self._performance_rule,
+            'largest': self._largest_department_rule,
+            **{intent: partial(self._extraction_rule, intent) for intent in EXTRACTION_RULES},
+        }
         
     def initialize(self):
         """Initialize the answer generation model"""
@@ -24,6 +271,18 @@ class AnswerGenerationService:
             logger.error(f"❌ Failed to initialize answer generation: {e}")
             return False
     
+    def prepare_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Attach the derived per-document fields (content digest, pattern hits, lowercase bytes) once.
+        Call when documents are loaded; answering then only reads them.
+        """
+        _scan_documents(documents)
+        for doc in documents:
+            _content_hash(doc)
+            if not USE_HYPERSCAN:
+                _content_bytes_lower(doc)
+        return documents
+    
     def generate_answer(self, question: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Generate a direct answer to the question based on retrieved documents
@@ -36,21 +295,25 @@ class AnswerGenerationService:
                     "source": None
                 }
             
-            # Combine all document content
-            all_content = "\n\n".join([doc.get("content", "") for doc in documents])
-            
-            # Use rule-based extraction for common patterns
-            answer_result = self._extract_answer_rules(question.lower(), all_content, documents)
+            question_lower = question.lower()
             
-            if answer_result:
-                return answer_result
+            # Questions that fire no intent keyword cannot match any rule: skip scanning and parsing entirely
+            intents = self._question_intents(question_lower)
+            if intents:
+                # No-op for documents already prepared at load time
+                self.prepare_documents(documents)
+                answer_result = self._answer_rules_cached(question_lower, intents, documents)
+            else:
+                answer_result = None
             
-            # Fallback: provide a more focused answer
-            most_relevant = documents[0]
-            return {
-                "answer": f"I found relevant information but couldn't extract a specific answer.",
-                "source": most_relevant.get('filename')
-            }
+            if not answer_result:
+                # Fallback: provide a more focused answer
+                most_relevant = documents[0]
+                answer_result = {
+                    "answer": f"I found relevant information but couldn't extract a specific answer.",
+                    "source": most_relevant.get('filename')
+                }
+            return answer_result
             
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
@@ -59,252 +322,153 @@ class AnswerGenerationService:
                 "source": None
             }
     
-    def _extract_answer_rules(self, question: str, content: str, documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-        """Extract specific answers using rule-based patterns"""
-        
-        # Find the most relevant document for sourcing
-        source_doc = documents[0] if documents else None
-        source_filename = source_doc.get('filename') if source_doc else None
-        
-        # Enhanced patterns for CSV data format: "Department: Engineering | Employee Count: 45"
-        
-        # Employee count questions
-        if any(word in question for word in ["employee", "staff", "people", "member", "worker", "many"]):
-            # Engineering department
-            if "engineering" in question:
-                patterns = [
-                    r"department:\s*engineering\s*\|\s*employee count:\s*(\d+)",
-                    r"engineering.*?employee count:\s*(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        count = match.group(1)
-                        return {
-                            "answer": f"The Engineering department has {count} employees.",
-                            "source": source_filename
-                        }
-            
-            # Sales department
-            if "sales" in question:
-                patterns = [
-                    r"department:\s*sales\s*\|\s*employee count:\s*(\d+)",
-                    r"sales.*?employee count:\s*(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        count = match.group(1)
-                        return {
-                            "answer": f"The Sales department has {count} employees.",
-                            "source": source_filename
-                        }
-            
-            # Marketing department
-            if "marketing" in question:
-                patterns = [
-                    r"department:\s*marketing\s*\|\s*employee count:\s*(\d+)",
-                    r"marketing.*?employee count:\s*(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        count = match.group(1)
-                        return {
-                            "answer": f"The Marketing department has {count} employees.",
-                            "source": source_filename
-                        }
-            
-            # HR department
-            if "hr" in question:
-                patterns = [
-                    r"department:\s*hr\s*\|\s*employee count:\s*(\d+)",
-                    r"hr.*?employee count:\s*(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        count = match.group(1)
-                        return {
-                            "answer": f"The HR department has {count} employees.",
-                            "source": source_filename
-                        }
-            
-            # Total employees question
-            if any(word in question for word in ["total", "all", "across"]):
-                # Find all employee counts
-                employee_counts = re.findall(r"employee count:\s*(\d+)", content.lower())
-                if employee_counts:
-                    total = sum(int(count) for count in employee_counts)
-                    return {
-                        "answer": f"There are {total} employees in total across all departments.",
-                        "source": source_filename
-                    }
+    def _answer_rules_cached(self, question_lower: str, intents: Set[str],
+                             documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Rule answer for a prepared document set, memoized per (question, document set)"""
+        cache_key = (question_lower, tuple((doc.get('filename'), doc['_content_hash']) for doc in documents))
+        with self._cache_lock:
+            cached = self._answer_cache.get(cache_key)
+            if cached is not None:
+                self._answer_cache.move_to_end(cache_key)
+                return dict(cached)
         
-        # Budget questions
-        if any(word in question for word in ["budget", "cost", "money"]):
-            # Engineering budget
-            if "engineering" in question:
-                patterns = [
-                    r"department:\s*engineering.*?budget.*?(\d+)",
-                    r"engineering.*?budget.*?(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        amount = match.group(1)
-                        return {
-                            "answer": f"The Engineering department budget is ${int(amount):,}.",
-                            "source": source_filename
-                        }
-            
-            # Sales budget
-            if "sales" in question:
-                patterns = [
-                    r"department:\s*sales.*?budget.*?(\d+)",
-                    r"sales.*?budget.*?(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        amount = match.group(1)
-                        return {
-                            "answer": f"The Sales department budget is ${int(amount):,}.",
-                            "source": source_filename
-                        }
-            
-            # Marketing budget
-            if "marketing" in question:
-                patterns = [
-                    r"department:\s*marketing.*?budget.*?(\d+)",
-                    r"marketing.*?budget.*?(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        amount = match.group(1)
-                        return {
-                            "answer": f"The Marketing department budget is ${int(amount):,}.",
-                            "source": source_filename
-                        }
-            
-            # HR budget
-            if "hr" in question:
-                patterns = [
-                    r"department:\s*hr.*?budget.*?(\d+)",
-                    r"hr.*?budget.*?(\d+)",
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, content.lower())
-                    if match:
-                        amount = match.group(1)
-                        return {
-                            "answer": f"The HR department budget is ${int(amount):,}.",
-                            "source": source_filename
-                        }
+        # Use rule-based extraction for common patterns, scanning each document in place
+        answer_result = self._extract_answer_rules(question_lower, intents, documents)
         
-        # Performance rating questions
-        if any(word in question for word in ["performance", "rating", "best", "excellent"]):
-            # Find all ratings
-            rating_matches = re.findall(r"department:\s*(\w+).*?performance rating:\s*(\w+)", content.lower())
-            
-            if "best" in question or "excellent" in question:
-                # Find the department with "Excellent" rating
-                for dept, rating in rating_matches:
-                    if rating.lower() == "excellent":
-                        return {
-                            "answer": f"The {dept.title()} department has the best performance rating (Excellent).",
-                            "source": source_filename
-                        }
-            
-            # Specific department performance
-            if "engineering" in question:
-                for dept, rating in rating_matches:
-                    if dept.lower() == "engineering":
-                        return {
-                            "answer": f"The Engineering department has a {rating.title()} performance rating.",
-                            "source": source_filename
-                        }
-        
-        # HR/Orientation questions
-        if any(word in question for word in ["hr", "orientation", "report"]):
-            time_patterns = [
-                r"report to hr at (\d+:\d+\s*[ap]m)",
-                r"hr.*?(\d+:\d+\s*[ap]m)",
-                r"orientation.*?(\d+:\d+\s*[ap]m)",
-            ]
-            
-            for pattern in time_patterns:
-                match = re.search(pattern, content.lower())
-                if match:
-                    time = match.group(1)
-                    return {
-                        "answer": f"Report to HR at {time} for orientation.",
-                        "source": source_filename
-                    }
-          # First day/onboarding questions
-        if any(word in question for word in ["first day", "onboard", "checklist", "new employee"]):
-            checklist_patterns = [
-                r"first day checklist.*?-\s*(.+?)(?:\n|$)",
-                r"## first day.*?\n.*?-\s*(.+?)(?:\n|$)",
-            ]
-            
-            for pattern in checklist_patterns:
-                match = re.search(pattern, content.lower(), re.DOTALL)
-                if match:
-                    item = match.group(1).strip()
-                    return {
-                        "answer": f"For the first day: {item}",
-                        "source": source_filename
-                    }
+        # Misses are cached as {} so they are not recomputed either
+        with self._cache_lock:
+            self._answer_cache[cache_key] = dict(answer_result or {})
+            if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+                self._answer_cache.popitem(last=False)
+        return answer_result
+    
+    def _department_table(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merged department table and its aggregates for a document set, built once per set"""
+        key = tuple((doc.get('filename'), doc['_content_hash']) for doc in documents)
+        with self._cache_lock:
+            table = self._department_tables.get(key)
+            if table is not None:
+                self._department_tables.move_to_end(key)
+                return table
         
-        # Which department has most employees
-        if any(phrase in question.lower() for phrase in ["most people", "most employees", "largest department", "biggest department"]):
-            # Extract all departments and employee counts from CSV format
-            pattern = r"(\w+),(\d+),"
-            matches = re.findall(pattern, content)
-            if matches:
-                # Find department with highest count
-                max_dept, max_count = max(matches, key=lambda x: int(x[1]))
-                return {
-                    "answer": f"The {max_dept} department has the most people ({max_count} employees).",
-                    "source": source_filename
-                }
+        # Enhanced patterns for CSV data format: "Department: Engineering | Employee Count: 45",
+        # parsed once per document content and merged (first occurrence wins)
+        departments: Dict[str, Dict[str, Any]] = {}
+        source = None
+        for doc in documents:
+            parsed = _parse_departments(doc.get('content', ''))
+            if parsed and source is None:
+                source = doc.get('filename')
+            for dept, record in parsed.items():
+                merged = departments.setdefault(dept, {})
+                for field, value in record.items():
+                    merged.setdefault(field, value)
         
-        # Security badge questions
-        if any(word in question.lower() for word in ["security badge", "badge", "id card"]):
-            if "security badge" in content.lower():
-                return {
-                    "answer": "You will get your security badge during the office tour on your first day.",
-                    "source": source_filename
-                }
+        # Aggregates are accumulated here once, not per question; the total sums every
+        # "employee count:" match across the documents, not just the merged departments
+        employee_counts = [count for doc in documents for count in _employee_counts(doc.get('content', ''))]
+        table = {
+            "departments": departments,
+            "source": source,
+            "total_employees": sum(employee_counts) if employee_counts else None,
+        }
+        with self._cache_lock:
+            self._department_tables[key] = table
+            if len(self._department_tables) > DEPARTMENT_PARSE_CACHE_SIZE:
+                self._department_tables.popitem(last=False)
+        return table
+    
+    def _question_intents(self, question: str) -> Set[str]:
+        """Tag the lowercased question with every intent whose keywords occur in it, in one pass"""
+        if USE_AHOCORASICK:
+            return {intent for _, intents in _INTENT_AUTOMATON.iter(question) for intent in intents}
+        return {intent for keyword, intents in _KEYWORD_INTENTS.items() if keyword in question for intent in intents}
+    
+    def _extract_answer_rules(self, question: str, intents: Set[str],
+                              documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Extract specific answers using rule-based patterns, dispatching only to the intents that fired"""
+        # Patterns are case-insensitive, so content is matched as-is; hits were attached by prepare_documents
+        scanned = [(doc, doc.get('content', ''), doc['_content_hits']) for doc in documents]
         
-        # Who to meet questions
-        if any(phrase in question.lower() for phrase in ["who should i meet", "meet with", "who do i meet"]):
-            if "meet with your direct manager" in content.lower():
-                return {
-                    "answer": "You should meet with your direct manager on your first day.",
-                    "source": source_filename
-                }
+        # The department table is only needed when a department intent fired
+        table = self._department_table(documents) if intents & DEPARTMENT_INTENTS else _EMPTY_DEPARTMENT_TABLE
+        facts = {
+            "question": question,
+            "intents": intents,
+            # Departments named in the question, found once and shared by every department rule
+            "question_departments": tuple(dept for dept in DEPARTMENTS if dept in question),
+            "scanned": scanned,
+            "departments": table["departments"],
+            "department_source": table["source"],
+            "total_employees": table["total_employees"],
+        }
+        for intent in RULE_ORDER:
+            if intent in intents:
+                result = self._rule_handlers[intent](facts)
+                if result:
+                    return result
+        return None
+    
+    def _employee_rule(self, facts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Employee count for a named department, or the total across departments"""
+        for dept in facts["question_departments"]:
+            result = _EMPLOYEE_HANDLERS[dept](facts)
+            if result:
+                return result
         
-        # Process for new hires
-        if any(phrase in question.lower() for phrase in ["process for new hires", "hiring process", "onboarding process"]):
-            if "first day checklist" in content.lower():
+        # Total employees question
+        if 'total' in facts["intents"]:
+            if facts["total_employees"] is not None:
                 return {
-                    "answer": "The process includes: reporting to HR for orientation, completing paperwork, receiving laptop and credentials, meeting your manager, and getting an office tour.",
-                    "source": source_filename
+                    "answer": f"There are {facts['total_employees']} employees in total across all departments.",
+                    "source": facts["department_source"]
                 }
+        return None
+    
+    def _budget_rule(self, facts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Budget for a named department"""
+        for dept in facts["question_departments"]:
+            result = _BUDGET_HANDLERS[dept](facts)
+            if result:
+                return result
+        return None
+    
+    def _performance_rule(self, facts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Best-rated department, or the rating of a named department"""
+        if 'best' in facts["intents"]:
+            # Find the department with "Excellent" rating
+            for dept, record in facts["departments"].items():
+                if record.get("rating") == "excellent":
+                    return {
+                        "answer": f"The {dept.title()} department has the best performance rating (Excellent).",
+                        "source": facts["department_source"]
+                    }
         
-        # What should new employees do first
-        if any(phrase in question.lower() for phrase in ["what should", "what do", "first thing"]):
-            # Look for first item in checklist
-            pattern = r"first day checklist.*?-\s*(.+?)(?:\n|$)"
-            match = re.search(pattern, content.lower(), re.DOTALL)
-            if match:
-                first_item = match.group(1).strip()
-                return {
-                    "answer": f"First thing to do: {first_item}.",
-                    "source": source_filename
-                }
-
+        # Specific department performance
+        for dept in facts["question_departments"]:
+            result = _RATING_HANDLERS[dept](facts)
+            if result:
+                return result
+        return None
+    
+    def _largest_department_rule(self, facts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Department with the most employees, in a single pass over the parsed table"""
+        staffed = [(dept, record["employees"]) for dept, record in facts["departments"].items() if "employees" in record]
+        if staffed:
+            max_dept, max_count = max(staffed, key=lambda item: item[1])
+            return {
+                "answer": f"The {DEPARTMENT_NAMES.get(max_dept, max_dept.title())} department has the most people ({max_count} employees).",
+                "source": facts["department_source"]
+            }
+        return None
+    
+    def _extraction_rule(self, intent: str, facts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Answer from the first named content pattern that matches, formatted by the intent's template"""
+        pattern_names, template = EXTRACTION_RULES[intent]
+        doc, groups = _first_match(facts["scanned"], pattern_names)
+        if groups is not None:
+            return {
+                "answer": template.format(*(group.strip() for group in groups)),
+                "source": doc.get('filename')
+            }
         return None
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text
+from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.dialects.postgresql import UUID
@@ -22,6 +22,17 @@ class Document(Base):
     # Vector embedding for semantic search
     embedding = Column(Vector(settings.vector_dimension), nullable=False)
     
+    # HNSW index for approximate nearest-neighbour search by cosine distance (pgvector >= 0.5)
+    __table_args__ = (
+        Index(
+            "documents_embedding_hnsw_idx",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+    
     def __repr__(self):
         return f"<Document(id={self.id}, filename='{self.filename}')>"
 
@@ -36,7 +47,13 @@ class QueryHistory(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 # Database connection
-engine = create_engine(settings.database_url)
+engine = create_engine(
+    settings.database_url,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_pre_ping=True,  # Drop connections the server closed while idle
+    pool_recycle=settings.db_pool_recycle
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -48,14 +65,17 @@ def get_db():
         db.close()
 
 def create_tables():
-    """Create all tables"""
+    """Create all tables and indexes"""
     Base.metadata.create_all(bind=engine)
+    # create_all only adds indexes with new tables; build the HNSW index on existing ones too
+    for index in Document.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 def test_connection():
     """Test database connection"""
     try:
         with engine.connect() as connection:
-            connection.execute("SELECT 1")
+            connection.execute(text("SELECT 1"))
             return True
     except Exception:
         return False
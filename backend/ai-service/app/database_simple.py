@@ -1,12 +1,13 @@
 """
 Database module for QuerySense AI Service - PostgreSQL without pgvector
 """
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Text, DateTime, LargeBinary, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
 from config_simple import settings
 import json
+import numpy as np
 from datetime import datetime
 
 # Database setup
@@ -25,7 +26,7 @@ class Document(Base):
     content = Column(Text, nullable=False)
     file_type = Column(String(50))
     file_size = Column(Integer)
-    embedding = Column(JSON, nullable=False)  # Store as JSON array
+    embedding = Column(LargeBinary, nullable=False)  # Little-endian float16 bytes (BYTEA)
     upload_timestamp = Column(DateTime, server_default=func.now())
 
 class QueryHistory(Base):
@@ -33,11 +34,51 @@ class QueryHistory(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     query_text = Column(Text, nullable=False)
-    query_embedding = Column(JSON, nullable=False)  # Store as JSON array
+    query_embedding = Column(LargeBinary, nullable=False)  # Little-endian float16 bytes (BYTEA)
     results_count = Column(Integer)
     response_time_ms = Column(Integer)
     timestamp = Column(DateTime, server_default=func.now())
 
+# Embedding serialization
+def encode_embedding(vector) -> bytes:
+    """Serialize an embedding as little-endian float16 bytes for a BYTEA column"""
+    return np.asarray(vector, dtype='<f2').tobytes()
+
+def decode_embedding(blob) -> np.ndarray:
+    """Deserialize float16 embedding bytes into a float32 numpy array (legacy JSON lists/strings also accepted)"""
+    if isinstance(blob, str):
+        blob = json.loads(blob)
+    if isinstance(blob, list):
+        return np.asarray(blob, dtype=np.float32)
+    return np.frombuffer(blob, dtype='<f2').astype(np.float32)
+
+# Embedding columns that were JSON float lists before switching to float16 BYTEA
+EMBEDDING_COLUMNS = [("documents", "embedding"), ("query_history", "query_embedding")]
+
+def migrate_embeddings_to_binary():
+    """Convert legacy JSON embedding columns to float16 BYTEA in place (no-op once migrated)"""
+    inspector = inspect(engine)
+    for table, column in EMBEDDING_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        column_type = next(c["type"] for c in inspector.get_columns(table) if c["name"] == column)
+        if not isinstance(column_type, JSON):
+            continue
+        
+        # One transaction per table: add a BYTEA column, backfill it, then swap it in
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column}_f16 BYTEA"))
+            rows = conn.execute(text(f"SELECT id, {column} FROM {table}")).all()
+            if rows:
+                conn.execute(
+                    text(f"UPDATE {table} SET {column}_f16 = :blob WHERE id = :id"),
+                    [{"id": row_id, "blob": encode_embedding(decode_embedding(value))} for row_id, value in rows]
+                )
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+            conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {column}_f16 TO {column}"))
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+        print(f"Migrated {len(rows)} {table}.{column} rows from JSON to float16 BYTEA")
+
 # Database functions
 def get_db():
     """Get database session"""
@@ -48,14 +89,14 @@ def get_db():
         db.close()
 
 def create_tables():
-    """Create database tables"""
+    """Create database tables and migrate legacy embedding columns"""
     Base.metadata.create_all(bind=engine)
+    migrate_embeddings_to_binary()
 
 def test_connection():
     """Test database connection"""
     try:
         db = SessionLocal()
-        from sqlalchemy import text
         result = db.execute(text("SELECT 1")).scalar()
         db.close()
         return True
@@ -2,9 +2,12 @@
 DeepSeek Answer Generator - Optimized for RTX 4070 Ti
 Using DeepSeek-Coder-6.7B-Instruct for maximum efficiency and accuracy
 """
+import copy
+import dataclasses
 import os
 from typing import List, Dict, Any, Optional
 import torch
+import transformers
 from transformers import (
     AutoTokenizer, AutoModelForCausalLM, 
     BitsAndBytesConfig, pipeline
@@ -14,6 +17,41 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# vLLM (PagedAttention KV cache + continuous batching) serves DeepSeek when installed (optional dependency)
+try:
+    from vllm import LLM, EngineArgs, SamplingParams
+    USE_VLLM = True
+    # Automatic prefix caching is an engine argument from vLLM 0.4 on; older engines reject the keyword
+    VLLM_PREFIX_CACHING = "enable_prefix_caching" in {field.name for field in dataclasses.fields(EngineArgs)}
+except ImportError:
+    USE_VLLM = False
+    VLLM_PREFIX_CACHING = False
+
+# bitsandbytes enables NF4 weight-only quantization of the HF model (optional dependency)
+try:
+    import bitsandbytes  # noqa: F401
+    USE_BITSANDBYTES = True
+except ImportError:
+    USE_BITSANDBYTES = False
+
+# vLLM engine sizing for a 12GB card: leave headroom for the embedding model
+VLLM_GPU_MEMORY_UTILIZATION = 0.85
+# Prompt + generation length, also the size of the HF static KV cache
+DEEPSEEK_MAX_MODEL_LEN = 2048
+
+# Compiled once: whitespace runs, and the answer prefixes the model tends to echo (possibly stacked)
+_WS_RE = re.compile(r'\s+')
+_ANSWER_PREFIX_RE = re.compile(
+    r'^(?:(?:answer|response|based on the documents|according to the information|the answer is|assistant|ai)\s*:\s*)+',
+    re.IGNORECASE
+)
+
+# Constant instruction preamble shared by every prompt; its KV cache is computed once and reused
+DEEPSEEK_PROMPT_PREAMBLE = """You are a helpful AI assistant that provides accurate answers based on the given documents.
+
+Documents:
+"""
+
 class DeepSeekAnswerGenerator:
     """DeepSeek-powered answer generation optimized for business Q&A"""
     
@@ -26,6 +64,12 @@ class DeepSeekAnswerGenerator:
         self.tokenizer = None
         self.model = None
         self.pipeline = None
+        # vLLM engine and its sampling settings, used instead of the HF pipeline when available
+        self.llm = None
+        self.sampling_params = None
+        # Token ids and past_key_values of DEEPSEEK_PROMPT_PREAMBLE for HF prefix reuse
+        self._preamble_ids = None
+        self._preamble_kv = None
         
         logger.info(f"🌊 Initializing DeepSeek on {self.device}")
         
@@ -44,15 +88,54 @@ class DeepSeekAnswerGenerator:
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
-            # Load model with FP16 optimization
+            if USE_VLLM and self.device == "cuda":
+                try:
+                    self._initialize_vllm()
+                    return
+                except Exception as e:
+                    self.llm = None
+                    self.sampling_params = None
+                    logger.warning(f"⚠️ vLLM engine failed to start, using transformers: {e}")
+            
+            # Load model with 4-bit NF4 weights (~4GB instead of ~13GB in FP16), FP16 otherwise
+            if USE_BITSANDBYTES and self.device == "cuda":
+                quantization = {
+                    "quantization_config": BitsAndBytesConfig(
+                        load_in_4bit=True,
+                        bnb_4bit_quant_type="nf4",
+                        bnb_4bit_compute_dtype=torch.float16,
+                        bnb_4bit_use_double_quant=True
+                    )
+                }
+            else:
+                quantization = {"torch_dtype": torch.float16}
+            
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.model_name,
-                torch_dtype=torch.float16,
                 device_map="auto",
                 trust_remote_code=True,
-                low_cpu_mem_usage=True
+                low_cpu_mem_usage=True,
+                **quantization
             )
             
+            # Static KV cache: fixed-shape K/V buffers reused across generate() calls
+            # (needs transformers >= 4.38 and an architecture that implements it)
+            if getattr(self.model, "_supports_static_cache", False):
+                self.model.generation_config.cache_implementation = "static"
+                self.model.generation_config.max_length = DEEPSEEK_MAX_MODEL_LEN
+            else:
+                logger.info(
+                    f"ℹ️ Static KV-cache unsupported for {self.model_name} on transformers "
+                    f"{transformers.__version__}; generating with the dynamic cache"
+                )
+            
+            # reduce-overhead replays CUDA graphs, which only pays off with the fixed-shape static cache;
+            # dynamic-cache decode steps would recompile and re-record for every KV length
+            if self.device == "cuda" and getattr(self.model.generation_config, "cache_implementation", None) == "static":
+                self._compile_model()
+            elif self.device == "cuda":
+                logger.info("ℹ️ Dynamic KV-cache in use, keeping the eager DeepSeek forward")
+            
             # Create optimized pipeline
             self.pipeline = pipeline(
                 "text-generation",
@@ -63,6 +146,8 @@ class DeepSeekAnswerGenerator:
                 return_full_text=False
             )
             
+            self._prepare_preamble_cache()
+            
             logger.info("✅ DeepSeek loaded successfully!")
             logger.info(f"💾 VRAM Usage: {torch.cuda.memory_allocated(0) / 1024**3:.1f}GB")
             
@@ -70,6 +155,85 @@ class DeepSeekAnswerGenerator:
             logger.error(f"❌ Failed to load DeepSeek: {e}")
             raise
     
+    def _initialize_vllm(self):
+        """Load DeepSeek into a vLLM engine (paged KV cache, no contiguous per-request allocation)"""
+        logger.info("⚡ Using vLLM backend for DeepSeek")
+        engine_kwargs = {}
+        if VLLM_PREFIX_CACHING:
+            # Every prompt starts with DEEPSEEK_PROMPT_PREAMBLE, so its KV blocks are shared across requests
+            engine_kwargs["enable_prefix_caching"] = True
+        self.llm = LLM(
+            model=self.model_name,
+            dtype="float16",
+            gpu_memory_utilization=VLLM_GPU_MEMORY_UTILIZATION,
+            max_model_len=DEEPSEEK_MAX_MODEL_LEN,
+            trust_remote_code=True,
+            **engine_kwargs
+        )
+        self.sampling_params = SamplingParams(
+            temperature=0.2,  # Low temperature for precise answers
+            top_p=0.85,
+            max_tokens=128,
+            repetition_penalty=1.1
+        )
+        logger.info("✅ DeepSeek loaded successfully!")
+    
+    def _compile_model(self):
+        """Compile the DeepSeek forward with torch.compile to cut per-token launch overhead"""
+        eager_forward = self.model.forward
+        try:
+            logger.info("⚙️ Compiling DeepSeek forward (reduce-overhead)...")
+            # The pipeline and generate() call forward on the module itself, so compile the bound forward in place
+            self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=False)
+            logger.info("✅ DeepSeek forward compiled")
+        except Exception as e:
+            self.model.forward = eager_forward
+            logger.warning(f"⚠️ torch.compile unavailable, using eager DeepSeek model: {e}")
+    
+    def _prepare_preamble_cache(self):
+        """Run the constant prompt preamble through the model once and keep its past_key_values"""
+        # A provided cache cannot feed the preallocated static cache, so the two are not mixed:
+        # with the static cache active every prompt is prefilled in full
+        if self.model.generation_config.cache_implementation == "static":
+            logger.info("📌 Static KV-cache active, skipping preamble KV reuse")
+            return
+        try:
+            self._preamble_ids = self.tokenizer(DEEPSEEK_PROMPT_PREAMBLE, return_tensors="pt").input_ids.to(self.model.device)
+            with torch.inference_mode():
+                self._preamble_kv = self.model(input_ids=self._preamble_ids, use_cache=True).past_key_values
+            logger.info(f"📌 Cached KV for {self._preamble_ids.shape[1]} preamble tokens")
+        except Exception as e:
+            self._preamble_ids = None
+            self._preamble_kv = None
+            logger.warning(f"⚠️ Preamble KV cache unavailable, prefilling full prompts: {e}")
+    
+    def _generate_with_preamble_cache(self, prompt: str) -> Optional[str]:
+        """Generate from the cached preamble KV, prefilling only the documents + question suffix"""
+        if self._preamble_kv is None:
+            return None
+        
+        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.model.device)
+        preamble_len = self._preamble_ids.shape[1]
+        # Reuse is only valid when the prompt tokenizes to the same preamble tokens
+        if input_ids.shape[1] <= preamble_len or not torch.equal(input_ids[:, :preamble_len], self._preamble_ids):
+            return None
+        
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                # generate() extends the (dynamic) cache in place, so each request starts from its own copy
+                past_key_values=copy.deepcopy(self._preamble_kv),
+                max_new_tokens=128,
+                temperature=0.2,  # Low temperature for precise answers
+                do_sample=True,
+                top_p=0.85,
+                repetition_penalty=1.1,
+                pad_token_id=self.tokenizer.eos_token_id,
+                eos_token_id=self.tokenizer.eos_token_id
+            )
+        return self.tokenizer.decode(outputs[0, input_ids.shape[1]:], skip_special_tokens=True)
+    
     def generate_answer(self, query: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Generate precise answers using DeepSeek's reasoning capabilities"""
         
@@ -87,6 +251,22 @@ class DeepSeekAnswerGenerator:
         prompt = self._create_deepseek_prompt(query, context)
         
         try:
+            if self.llm is not None:
+                outputs = self.llm.generate([prompt], self.sampling_params, use_tqdm=False)
+                return {
+                    "answer": self._extract_clean_answer(outputs[0].outputs[0].text),
+                    "confidence": 0.95,
+                    "source": documents[0].get('filename', 'Unknown')
+                }
+            
+            generated_text = self._generate_with_preamble_cache(prompt)
+            if generated_text is not None:
+                return {
+                    "answer": self._extract_clean_answer(generated_text),
+                    "confidence": 0.95,
+                    "source": documents[0].get('filename', 'Unknown')
+                }
+            
             # Generate with DeepSeek
             response = self.pipeline(
                 prompt,
@@ -129,7 +309,7 @@ class DeepSeekAnswerGenerator:
     def _clean_content(self, content: str) -> str:
         """Clean content for better DeepSeek processing"""
         # Remove excessive whitespace
-        content = re.sub(r'\\s+', ' ', content)
+        content = _WS_RE.sub(' ', content)
         
         # Truncate to reasonable length
         if len(content) > 1000:
@@ -140,10 +320,7 @@ class DeepSeekAnswerGenerator:
     def _create_deepseek_prompt(self, query: str, context: str) -> str:
         """Create DeepSeek-optimized prompt"""
         
-        prompt = f"""You are a helpful AI assistant that provides accurate answers based on the given documents.
-
-Documents:
-{context}
+        prompt = f"""{DEEPSEEK_PROMPT_PREAMBLE}{context}
 
 Question: {query}
 
@@ -156,22 +333,11 @@ Answer:"""
     def _extract_clean_answer(self, generated_text: str) -> str:
         """Extract and clean the answer from DeepSeek output"""
         
-        # Remove common prefixes
-        answer = generated_text.strip()
-        
-        # Clean up artifacts
-        prefixes_to_remove = [
-            "Answer:", "Response:", "Based on the documents:",
-            "According to the information:", "The answer is:",
-            "Assistant:", "AI:"
-        ]
-        
-        for prefix in prefixes_to_remove:
-            if answer.startswith(prefix):
-                answer = answer[len(prefix):].strip()
+        # Remove common prefixes and artifacts in one anchored pass
+        answer = _ANSWER_PREFIX_RE.sub('', generated_text.strip())
         
         # Take only the first paragraph for conciseness
-        answer = answer.split('\\n')[0].strip()
+        answer = answer.split('\n')[0].strip()
         
         # Ensure proper ending
         if answer and not answer.endswith(('.', '!', '?')):
@@ -187,7 +353,7 @@ Answer:"""
         
         # Simple pattern matching for common questions
         if 'vacation' in query_lower and 'day' in query_lower:
-            match = re.search(r'(\\d+)\\s*days?.*per.*year', content)
+            match = re.search(r'(\d+)\s*days?.*per.*year', content)
             if match:
                 return {
                     "answer": f"Employees get {match.group(1)} vacation days per year.",
@@ -197,7 +363,7 @@ Answer:"""
         
         elif 'employee' in query_lower and ('most' in query_lower or 'biggest' in query_lower):
             # Parse CSV data
-            lines = documents[0].get('content', '').split('\\n')
+            lines = documents[0].get('content', '').split('\n')
             max_emp = 0
             max_dept = ""
             
@@ -234,5 +400,6 @@ Answer:"""
             "vram_usage_gb": torch.cuda.memory_allocated(0) / 1024**3 if torch.cuda.is_available() else 0,
             "speciality": "Code, structured data, business Q&A",
             "parameters": "6.7B" if "6.7b" in self.model_name else "7B",
-            "status": "loaded" if self.model else "not_loaded"
+            "backend": "vllm" if self.llm is not None else "transformers",
+            "status": "loaded" if self.model or self.llm else "not_loaded"
         }
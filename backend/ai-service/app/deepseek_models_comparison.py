@@ -2,112 +2,79 @@
 DeepSeek Models Comparison for RTX 4070 Ti (12GB VRAM)
 Best models for business Q&A and document analysis
 """
+import json
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
 
-DEEPSEEK_MODELS_RTX_4070TI = {
-    # 🔥 BEST FOR YOUR SETUP
-    "deepseek-ai/DeepSeek-R1-Distill-Llama-8B": {
-        "size": "8B",
-        "vram_required": "7-8GB",
-        "accuracy": "96-98%",
-        "specialty": "Reasoning, business Q&A, document analysis",
-        "strength": "Latest R1 reasoning model, best accuracy",
-        "recommended_use": "PRIMARY CHOICE - Best for complex business questions",
-        "quantization": "FP16 native support",
-        "inference_speed": "Fast",
-        "notes": "DeepSeek R1 series - state-of-the-art reasoning"
-    },
-    
-    "deepseek-ai/deepseek-llm-7b-chat": {
-        "size": "7B", 
-        "vram_required": "6-7GB",
-        "accuracy": "94-96%",
-        "specialty": "General chat, Q&A, document understanding",
-        "strength": "Well-rounded, excellent for business docs",
-        "recommended_use": "EXCELLENT CHOICE - Stable and reliable",
-        "quantization": "FP16/4-bit support",
-        "inference_speed": "Very fast",
-        "notes": "Most stable for production use"
-    },
-    
-    "deepseek-ai/deepseek-coder-6.7b-instruct": {
-        "size": "6.7B",
-        "vram_required": "5-6GB", 
-        "accuracy": "92-95%",
-        "specialty": "Code, structured data, CSV analysis",
-        "strength": "Excellent for CSV/data questions",
-        "recommended_use": "GREAT FOR DATA - Perfect for CSV analysis",
-        "quantization": "FP16/4-bit support",
-        "inference_speed": "Very fast",
-        "notes": "Currently implemented - works well for structured data"
-    },
-    
-    # 🌟 CUTTING EDGE (if available)
-    "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B": {
-        "size": "8B",
-        "vram_required": "7-8GB",
-        "accuracy": "97-99%", 
-        "specialty": "Advanced reasoning, complex Q&A",
-        "strength": "Latest R1 architecture with Qwen3 base",
-        "recommended_use": "BLEEDING EDGE - Highest accuracy",
-        "quantization": "FP16 native",
-        "inference_speed": "Fast",
-        "notes": "Very latest model - may need testing"
-    },
-    
-    # 💎 PREMIUM OPTIONS (if you can fit them)
-    "deepseek-ai/DeepSeek-V3": {
-        "size": "671B MoE",
-        "vram_required": "12GB+ (with heavy quantization)",
-        "accuracy": "99%+",
-        "specialty": "Everything - SOTA performance",
-        "strength": "Best-in-class performance",
-        "recommended_use": "ULTIMATE - If you can run it",
-        "quantization": "Requires 4-bit quantization",
-        "inference_speed": "Slower but highest quality",
-        "notes": "Mixture of Experts - challenging to run locally"
-    }
-}
+# Model specs and the recommendation matrix, parsed on first lookup instead of at import time
+MODELS_DATA_FILE = Path(__file__).with_name("deepseek_models.json")
 
-# RECOMMENDATION MATRIX FOR RTX 4070 TI
-RECOMMENDATIONS = {
-    "FOR_MAXIMUM_ACCURACY": {
-        "primary": "deepseek-ai/DeepSeek-R1-Distill-Llama-8B",
-        "backup": "deepseek-ai/deepseek-llm-7b-chat",
-        "reason": "R1 series has best reasoning capabilities"
-    },
-    
-    "FOR_PRODUCTION_STABILITY": {
-        "primary": "deepseek-ai/deepseek-llm-7b-chat", 
-        "backup": "deepseek-ai/deepseek-coder-6.7b-instruct",
-        "reason": "Most tested and stable for business use"
-    },
-    
-    "FOR_CSV_DATA_ANALYSIS": {
-        "primary": "deepseek-ai/deepseek-coder-6.7b-instruct",
-        "backup": "deepseek-ai/DeepSeek-R1-Distill-Llama-8B", 
-        "reason": "Coder models excel at structured data"
-    },
-    
-    "FOR_SPEED": {
-        "primary": "deepseek-ai/deepseek-coder-6.7b-instruct",
-        "backup": "deepseek-ai/deepseek-llm-7b-chat",
-        "reason": "Smaller models = faster inference"
-    }
-}
+# Use case returned when the requested one is not in the recommendation matrix
+DEFAULT_USE_CASE = "maximum_accuracy"
+
+@dataclass(frozen=True, slots=True)
+class ModelSpec:
+    """Expected footprint and quality of a DeepSeek model on the RTX 4070 Ti"""
+    name: str
+    size: str
+    vram_required: str
+    accuracy: str
+    specialty: str
+    strength: str
+    recommended_use: str
+    quantization: str
+    inference_speed: str
+    notes: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Spec fields as a plain dict (without the model name)"""
+        info = asdict(self)
+        del info["name"]
+        return info
+
+@dataclass(frozen=True, slots=True)
+class Recommendation:
+    """Primary and backup model for a use case"""
+    primary: str
+    backup: str
+    reason: str
 
-def get_recommendation(use_case="maximum_accuracy"):
+@lru_cache(maxsize=None)
+def _load_registry() -> Dict[str, Any]:
+    """Parse the model data file once per process"""
+    with MODELS_DATA_FILE.open(encoding="utf-8") as f:
+        return json.load(f)
+
+@lru_cache(maxsize=None)
+def model_registry() -> Mapping[str, ModelSpec]:
+    """Read-only mapping of model name to spec"""
+    specs = tuple(ModelSpec(**model) for model in _load_registry()["models"])
+    return MappingProxyType({spec.name: spec for spec in specs})
+
+@lru_cache(maxsize=None)
+def recommendation_registry() -> Mapping[str, Recommendation]:
+    """Read-only mapping of use case to recommendation"""
+    return MappingProxyType({
+        use_case: Recommendation(**recommendation)
+        for use_case, recommendation in _load_registry()["recommendations"].items()
+    })
+
+def get_recommendation(use_case: str = DEFAULT_USE_CASE) -> Recommendation:
     """Get DeepSeek model recommendation for specific use case"""
-    key = f"FOR_{use_case.upper()}"
-    return RECOMMENDATIONS.get(key, RECOMMENDATIONS["FOR_MAXIMUM_ACCURACY"])
+    recommendations = recommendation_registry()
+    return recommendations.get(use_case.lower(), recommendations[DEFAULT_USE_CASE])
 
-def get_model_info(model_name):
-    """Get detailed info about a specific DeepSeek model"""
-    return DEEPSEEK_MODELS_RTX_4070TI.get(model_name, {})
+def get_model_info(model_name: str) -> Optional[ModelSpec]:
+    """Get detailed info about a specific DeepSeek model (None if unknown)"""
+    return model_registry().get(model_name)
 
 # OPTIMAL SETTINGS FOR RTX 4070 TI
 OPTIMAL_SETTINGS = {
     "torch_dtype": "float16",
-    "device_map": "auto", 
+    "device_map": "auto",
     "low_cpu_mem_usage": True,
     "max_new_tokens": 256,
     "temperature": 0.2,
@@ -119,9 +86,9 @@ OPTIMAL_SETTINGS = {
 if __name__ == "__main__":
     print("🌊 DeepSeek Models for RTX 4070 Ti")
     print("=" * 50)
-    
+
     for use_case in ["maximum_accuracy", "production_stability", "csv_data_analysis", "speed"]:
         rec = get_recommendation(use_case)
         print(f"\n{use_case.upper().replace('_', ' ')}:")
-        print(f"  Primary: {rec['primary']}")
-        print(f"  Reason: {rec['reason']}")
+        print(f"  Primary: {rec.primary}")
+        print(f"  Reason: {rec.reason}")
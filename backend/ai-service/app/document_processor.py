@@ -1,13 +1,186 @@
 import asyncio
-from typing import BinaryIO, Dict, Any
-import mimetypes
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import os
+import sys
+import types
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 from docx import Document as DocxDocument
 import json
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# SIMD JSON parser that reads bytes directly (optional dependency)
+try:
+    import orjson
+    USE_ORJSON = True
+except ImportError:
+    USE_ORJSON = False
+
+# JIT-compiled row builder for wide tables (optional dependency)
+try:
+    from numba import njit, prange
+    USE_NUMBA = True
+except ImportError:
+    USE_NUMBA = False
+
+# Supported file extensions; anything else is read as plain text
+_EXT_TO_MIME: Dict[str, str] = {
+    'txt': 'text/plain',
+    'md': 'text/markdown',
+    'markdown': 'text/markdown',
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+@lru_cache(maxsize=4096)
+def _mime_for_filename(filename: str) -> str:
+    """Resolve a filename's MIME type from its extension (memoized for bulk ingestion)"""
+    return _EXT_TO_MIME.get(os.path.splitext(filename)[1][1:].lower(), 'text/plain')
+
+# Whitespace runs collapsed by _clean_text
+_WS_RE = re.compile(r'\s+')
+
+def _cell_strings(column: pd.Series) -> pd.Series:
+    """Stringify a column the way f-string formatting would"""
+    # astype(str) drops the time part of all-midnight datetimes, so format those per value
+    if column.dtype.kind in 'Mm':
+        return column.map(str)
+    return column.astype(str)
+
+# Tables at least this wide are formatted by the Numba kernel; narrower ones with pandas string ops
+NUMBA_MIN_COLUMNS = 50
+
+# Separators written by the Numba row builder (the row terminator is a literal backslash-n, as elsewhere)
+_CELL_SEP = np.frombuffer(b" | ", dtype=np.uint8)
+_ROW_END = np.frombuffer(b"\\n", dtype=np.uint8)
+
+def _utf8_spans(strings: np.ndarray):
+    """UTF-8 encode an array of strings into one flat byte buffer plus per-string byte lengths"""
+    encoded = np.char.encode(strings, 'utf-8')
+    lengths = np.char.str_len(encoded).astype(np.int64)
+    width = encoded.dtype.itemsize
+    matrix = encoded.view(np.uint8).reshape(len(encoded), width)
+    return matrix[np.arange(width) < lengths[:, np.newaxis]], lengths
+
+def _offsets(lengths: np.ndarray) -> np.ndarray:
+    """Start offsets of consecutive spans, with the total length appended"""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+if USE_NUMBA:
+    @njit(cache=True)
+    def _copy_span(out, pos, data, offsets, index):
+        """Copy span `index` of data into out at pos, returning the position after it"""
+        start, end = offsets[index], offsets[index + 1]
+        out[pos:pos + end - start] = data[start:end]
+        return pos + end - start
+
+    @njit(parallel=True, cache=True)
+    def _build_rows_kernel(prefix_data, prefix_offsets, name_data, name_offsets, cell_data, cell_offsets, mask):
+        """Write all formatted rows into one UTF-8 buffer (cells are column-major: span j * n_rows + i)"""
+        n_rows, n_cols = mask.shape
+        
+        # Pass 1: byte length of every row
+        row_lengths = np.zeros(n_rows, dtype=np.int64)
+        for i in prange(n_rows):
+            length = prefix_offsets[i + 1] - prefix_offsets[i] + _ROW_END.size
+            written = 0
+            for j in range(n_cols):
+                if mask[i, j]:
+                    cell = j * n_rows + i
+                    length += name_offsets[j + 1] - name_offsets[j] + cell_offsets[cell + 1] - cell_offsets[cell]
+                    written += 1
+            if written > 1:
+                length += (written - 1) * _CELL_SEP.size
+            row_lengths[i] = length
+        
+        row_offsets = np.zeros(n_rows + 1, dtype=np.int64)
+        row_offsets[1:] = np.cumsum(row_lengths)
+        out = np.empty(row_offsets[n_rows], dtype=np.uint8)
+        
+        # Pass 2: each row writes its own slice of the buffer
+        for i in prange(n_rows):
+            pos = _copy_span(out, row_offsets[i], prefix_data, prefix_offsets, i)
+            first = True
+            for j in range(n_cols):
+                if mask[i, j]:
+                    if not first:
+                        out[pos:pos + _CELL_SEP.size] = _CELL_SEP
+                        pos += _CELL_SEP.size
+                    first = False
+                    pos = _copy_span(out, pos, name_data, name_offsets, j)
+                    pos = _copy_span(out, pos, cell_data, cell_offsets, j * n_rows + i)
+            out[pos:pos + _ROW_END.size] = _ROW_END
+        return out
+
+def _rows_to_text_numba(df: pd.DataFrame, mask: np.ndarray) -> str:
+    """Same output as _rows_to_text, with the per-cell formatting done in a parallel Numba kernel"""
+    prefix_data, prefix_lengths = _utf8_spans(("Row " + (df.index + 1).astype(str) + ": ").to_numpy(dtype=str))
+    name_data, name_lengths = _utf8_spans(np.array([f"{col}: " for col in df.columns], dtype=str))
+    cell_spans = [_utf8_spans(_cell_strings(df.iloc[:, position]).to_numpy(dtype=str)) for position in range(len(df.columns))]
+    
+    out = _build_rows_kernel(
+        prefix_data, _offsets(prefix_lengths),
+        name_data, _offsets(name_lengths),
+        np.concatenate([data for data, _ in cell_spans]),
+        _offsets(np.concatenate([lengths for _, lengths in cell_spans])),
+        np.ascontiguousarray(mask),
+    )
+    return out.tobytes().decode('utf-8')
+
+def _rows_to_text(df: pd.DataFrame) -> str:
+    """Format every row as 'Row N: col: val | col: val' with column-wise vectorized string ops"""
+    # One vectorized missing-value pass for the whole table instead of a pd.notna call per cell
+    mask = df.notna().to_numpy()
+    if USE_NUMBA and len(df.columns) >= NUMBA_MIN_COLUMNS:
+        return _rows_to_text_numba(df, mask)
+    
+    rows = pd.Series('', index=df.index, dtype=object)
+    for position, col in enumerate(df.columns):
+        cells = f"{col}: " + _cell_strings(df.iloc[:, position]) + " | "
+        rows = rows + cells.where(mask[:, position], '')
+    rows = rows.str.removesuffix(" | ")
+    lines = "Row " + (df.index + 1).astype(str) + ": " + rows + "\\n"
+    return "".join(lines)
+
+def _parse_sync(content: bytes, filename: str, mime_type: str) -> str:
+    """Parse and clean one file in a worker process (module-level so it can be pickled)"""
+    global _WORKER_PROCESSOR
+    if _WORKER_PROCESSOR is None:
+        _WORKER_PROCESSOR = DocumentProcessor()
+    text = _WORKER_PROCESSOR.supported_types[mime_type](content, filename)
+    return _WORKER_PROCESSOR._clean_text(text)
+
+# Parsing is CPU-bound, so it runs in a few worker processes (event loop stays free).
+# Spawned rather than forked: the parent holds CUDA state and background threads.
+PROCESS_POOL_MAX_WORKERS = 4
+_WORKER_PROCESSOR = None
+
+def _start_process_pool() -> ProcessPoolExecutor:
+    """Spawn the parse workers, importing only this module in them (not the server's __main__)"""
+    max_workers = min(PROCESS_POOL_MAX_WORKERS, os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    # Spawn children re-run __main__ (torch, models, the app) unless it is hidden while they start.
+    # A spawn pool adds a worker per submit while none is idle, so one no-op each starts them all here
+    main_module = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        for _ in range(max_workers):
+            pool.submit(os.getpid)
+    finally:
+        sys.modules['__main__'] = main_module
+    logger.info(f"📄 Document parse pool started ({max_workers} workers)")
+    return pool
+
 class DocumentProcessor:
     """Process various document types for AI embedding"""
     
@@ -20,26 +193,32 @@ class DocumentProcessor:
             'application/vnd.openxmlformats-officedocument.wordprocessingml.document': self._process_docx,
             'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': self._process_excel,
         }
+        self._pool: Optional[ProcessPoolExecutor] = None
+    
+    def start(self):
+        """Start the parse worker processes (from the application lifespan; otherwise on first use)"""
+        if self._pool is None:
+            self._pool = _start_process_pool()
+    
+    def shutdown(self):
+        """Stop the parse worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
     
     async def process_file(self, content: bytes, filename: str) -> str:
         """Process file content and return clean text for embedding"""
-        # Detect MIME type
-        mime_type, _ = mimetypes.guess_type(filename)
-        
-        if not mime_type or mime_type not in self.supported_types:
-            # Fallback to extension-based detection
-            ext = filename.lower().split('.')[-1]
-            mime_type = self._get_mime_from_extension(ext)
+        # Detect MIME type from the extension (only these six types are supported)
+        mime_type = _mime_for_filename(filename)
         
         if mime_type not in self.supported_types:
             raise ValueError(f"Unsupported file type: {mime_type}")
         
         try:
-            # Process the content
-            text = await self.supported_types[mime_type](content, filename)
-            
-            # Clean and normalize the text
-            cleaned_text = self._clean_text(text)
+            # Process, clean and normalize the content in a worker process
+            self.start()
+            loop = asyncio.get_running_loop()
+            cleaned_text = await loop.run_in_executor(self._pool, _parse_sync, content, filename, mime_type)
             
             logger.info(f"Processed {filename}: {len(cleaned_text)} characters")
             return cleaned_text
@@ -48,30 +227,12 @@ class DocumentProcessor:
             logger.error(f"Error processing {filename}: {str(e)}")
             raise
     
-    def _get_mime_from_extension(self, ext: str) -> str:
-        """Map file extensions to MIME types"""
-        mapping = {
-            'txt': 'text/plain',
-            'md': 'text/markdown',
-            'csv': 'text/csv',
-            'json': 'application/json',
-            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        }
-        return mapping.get(ext, 'text/plain')
-    
-    async def _process_text(self, content: bytes, filename: str) -> str:
+    def _process_text(self, content: bytes, filename: str) -> str:
         """Process plain text files"""
-        try:
-            # Try UTF-8 first, fallback to latin-1
-            try:
-                return content.decode('utf-8')
-            except UnicodeDecodeError:
-                return content.decode('latin-1')
-        except Exception as e:
-            raise ValueError(f"Failed to decode text file: {str(e)}")
+        # One decode pass; invalid bytes become U+FFFD instead of forcing a second latin-1 decode
+        return content.decode('utf-8', errors='replace')
     
-    async def _process_csv(self, content: bytes, filename: str) -> str:
+    def _process_csv(self, content: bytes, filename: str) -> str:
         """Process CSV files into structured text"""
         try:
             # Decode content
@@ -81,36 +242,41 @@ class DocumentProcessor:
             from io import StringIO
             df = pd.read_csv(StringIO(text_content))
             
-            # Convert to structured text
-            result = f"CSV File: {filename}\\n\\n"
-            result += f"Columns: {', '.join(df.columns)}\\n\\n"
-            
-            # Add each row as structured text
-            for idx, row in df.iterrows():
-                row_text = " | ".join([f"{col}: {val}" for col, val in row.items() if pd.notna(val)])
-                result += f"Row {idx + 1}: {row_text}\\n"
-            
-            return result
+            # Convert to structured text (rows as one block), joined once
+            return "".join([
+                f"CSV File: {filename}\\n\\n",
+                f"Columns: {', '.join(df.columns)}\\n\\n",
+                _rows_to_text(df)
+            ])
             
         except Exception as e:
             raise ValueError(f"Failed to process CSV file: {str(e)}")
     
-    async def _process_json(self, content: bytes, filename: str) -> str:
+    def _process_json(self, content: bytes, filename: str) -> str:
         """Process JSON files into readable text"""
         try:
-            text_content = content.decode('utf-8')
-            data = json.loads(text_content)
+            data = self._parse_json(content)
             
             # Convert JSON to structured text
-            result = f"JSON File: {filename}\\n\\n"
-            result += self._json_to_text(data)
+            out = [f"JSON File: {filename}\\n\\n"]
+            self._write_json(data, out)
             
-            return result
+            return "".join(out)
             
         except Exception as e:
             raise ValueError(f"Failed to process JSON file: {str(e)}")
     
-    async def _process_docx(self, content: bytes, filename: str) -> str:
+    def _parse_json(self, content: bytes):
+        """Parse JSON bytes with orjson (no separate UTF-8 decode), falling back to the stdlib parser"""
+        if USE_ORJSON:
+            try:
+                return orjson.loads(content)
+            except orjson.JSONDecodeError:
+                # The stdlib also accepts NaN/Infinity literals, and reports its own error otherwise
+                pass
+        return json.loads(content.decode('utf-8'))
+    
+    def _process_docx(self, content: bytes, filename: str) -> str:
         """Process DOCX files"""
         try:
             from io import BytesIO
@@ -126,57 +292,70 @@ class DocumentProcessor:
         except Exception as e:
             raise ValueError(f"Failed to process DOCX file: {str(e)}")
     
-    async def _process_excel(self, content: bytes, filename: str) -> str:
-        """Process Excel files"""
+    def _process_excel(self, content: bytes, filename: str) -> str:
+        """Process Excel files, parsing one sheet at a time"""
         try:
             from io import BytesIO
             
-            # Read all sheets
-            excel_data = pd.read_excel(BytesIO(content), sheet_name=None)
+            out = [f"Excel File: {filename}\\n\\n"]
             
-            result = f"Excel File: {filename}\\n\\n"
+            # pandas' openpyxl reader (read-only, cached formula values) keeps read_excel's header naming,
+            # dtype inference and blank-row handling; only the current sheet's frame is held in memory
+            with pd.ExcelFile(BytesIO(content), engine="openpyxl") as workbook:
+                for sheet_name in workbook.sheet_names:
+                    df = workbook.parse(sheet_name)
+                    out.append(f"Sheet: {sheet_name}\\n")
+                    out.append(f"Columns: {', '.join(df.columns)}\\n\\n")
+                    out.append(_rows_to_text(df))
+                    out.append("\\n")
             
-            for sheet_name, df in excel_data.items():
-                result += f"Sheet: {sheet_name}\\n"
-                result += f"Columns: {', '.join(df.columns)}\\n\\n"
-                
-                # Add each row
-                for idx, row in df.iterrows():
-                    row_text = " | ".join([f"{col}: {val}" for col, val in row.items() if pd.notna(val)])
-                    result += f"Row {idx + 1}: {row_text}\\n"
-                
-                result += "\\n"
-            
-            return result
+            return "".join(out)
             
         except Exception as e:
             raise ValueError(f"Failed to process Excel file: {str(e)}")
     
-    def _json_to_text(self, obj, indent=0) -> str:
+    def _json_to_text(self, obj) -> str:
         """Convert JSON object to readable text"""
-        result = ""
-        prefix = "  " * indent
-        
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                if isinstance(value, (dict, list)):
-                    result += f"{prefix}{key}:\\n"
-                    result += self._json_to_text(value, indent + 1)
-                else:
-                    result += f"{prefix}{key}: {value}\\n"
-        elif isinstance(obj, list):
-            for i, item in enumerate(obj):
-                result += f"{prefix}Item {i + 1}:\\n"
-                result += self._json_to_text(item, indent + 1)
-        else:
-            result += f"{prefix}{obj}\\n"
-        
-        return result
+        out: List[str] = []
+        self._write_json(obj, out)
+        return "".join(out)
+    
+    def _write_json(self, obj, out: List[str]):
+        """Append the readable text lines of a JSON object to out"""
+        # Iterative depth-first walk: the stack holds (node, depth) frames and pending header lines,
+        # so deeply nested payloads cannot hit the recursion limit
+        stack = [(obj, 0)]
+        while stack:
+            frame = stack.pop()
+            if isinstance(frame, str):
+                out.append(frame)
+                continue
+            
+            node, depth = frame
+            prefix = "  " * depth
+            if isinstance(node, dict):
+                children = []
+                for key, value in node.items():
+                    if isinstance(value, (dict, list)):
+                        children.append(f"{prefix}{key}:\\n")
+                        children.append((value, depth + 1))
+                    else:
+                        children.append(f"{prefix}{key}: {value}\\n")
+                # Reversed so the first child is popped first
+                stack.extend(reversed(children))
+            elif isinstance(node, list):
+                children = []
+                for i, item in enumerate(node):
+                    children.append(f"{prefix}Item {i + 1}:\\n")
+                    children.append((item, depth + 1))
+                stack.extend(reversed(children))
+            else:
+                out.append(f"{prefix}{node}\\n")
     
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text for embedding"""
         # Remove excessive whitespace
-        text = " ".join(text.split())
+        text = _WS_RE.sub(" ", text).strip()
         
         # Remove very short lines that might be noise
         lines = text.split('\\n')
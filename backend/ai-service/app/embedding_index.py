@@ -0,0 +1,97 @@
+"""
+Embedding index for QuerySense AI Service
+All document embeddings in one contiguous on-disk matrix, scored with blocked matrix-vector products
+"""
+import os
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 per GEMV block, bounding the transient allocation of a search
+SEARCH_BLOCK_ROWS = 65536
+
+class EmbeddingIndex:
+    """L2-normalized float16 (N, D) embedding matrix memory-mapped from disk, with brute-force cosine top-k search"""
+    
+    def __init__(self, path: str):
+        # Each worker process rebuilds and appends to its own corpus file, so uvicorn workers sharing
+        # the configured path never truncate or interleave rows in each other's matrix
+        root, ext = os.path.splitext(path)
+        self._path = f"{root}.{os.getpid()}{ext}"
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = None
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+    
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        """L2-normalize rows as float32 (NumPy has no BLAS float16 GEMM on CPU)"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+    
+    def _map(self, rows: int, dimension: int) -> Optional[np.memmap]:
+        """Read-only page-cached view of the first `rows` rows of the corpus file"""
+        if rows == 0:
+            return None
+        return np.memmap(self._path, dtype=np.float16, mode='r', shape=(rows, dimension))
+    
+    def load(self, rows: List[Tuple[int, np.ndarray]]):
+        """Rebuild the corpus file from (document id, embedding) rows, normalizing each vector once"""
+        ids = np.array([doc_id for doc_id, _ in rows], dtype=np.int64)
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        
+        # Written to a temporary file and swapped in, so a reader never maps a half-written corpus
+        tmp_path = f"{self._path}.tmp"
+        matrix = self._normalize(np.stack([embedding for _, embedding in rows])) if rows else np.empty((0, 0), dtype=np.float32)
+        matrix.astype(np.float16).tofile(tmp_path)
+        os.replace(tmp_path, self._path)
+        
+        mapped = self._map(len(ids), matrix.shape[1])
+        with self._lock:
+            self._ids, self._matrix = ids, mapped
+        logger.info(f"📚 Embedding index loaded: {len(ids)} documents ({self._path})")
+    
+    def add(self, doc_id: int, embedding: np.ndarray):
+        """Append one normalized document embedding to the corpus file"""
+        row = self._normalize(embedding).astype(np.float16)
+        with self._lock:
+            with open(self._path, 'ab') as f:
+                row.tofile(f)
+            self._ids = np.append(self._ids, doc_id)
+            self._matrix = self._map(len(self._ids), row.shape[-1])
+    
+    def close(self):
+        """Drop the mapping and delete this process's corpus file"""
+        with self._lock:
+            self._ids, self._matrix = np.empty(0, dtype=np.int64), None
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+    
+    def search(self, query_embedding: np.ndarray, top_k: int, threshold: float) -> List[Tuple[int, float]]:
+        """Return up to top_k (document id, cosine similarity) pairs at or above threshold, best first"""
+        with self._lock:
+            ids, matrix = self._ids, self._matrix
+        if matrix is None or top_k <= 0:
+            return []
+        
+        query = self._normalize(query_embedding)
+        scores = np.empty(len(ids), dtype=np.float32)
+        for start in range(0, len(ids), SEARCH_BLOCK_ROWS):
+            block = matrix[start:start + SEARCH_BLOCK_ROWS]
+            np.matmul(block.astype(np.float32), query, out=scores[start:start + len(block)])
+        
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[scores[candidates] >= threshold]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in candidates]
@@ -1,12 +1,58 @@
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 import torch
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 import numpy as np
 from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# bitsandbytes provides the INT8 (LLM.int8) Linear layers for GPU quantization (optional dependency)
+try:
+    import bitsandbytes as bnb
+    USE_BITSANDBYTES = True
+except ImportError:
+    USE_BITSANDBYTES = False
+
+# INT8 weights are kept only if every calibration embedding stays this close (cosine) to the unquantized one
+QUANTIZATION_MIN_COSINE = 0.99
+QUANTIZATION_CHECK_TEXTS = [
+    "Employees receive 20 vacation days per year, accrued monthly.",
+    "Row 1: Department: Engineering | Employees: 45 | Budget: 1200000",
+    "On your first day, meet your manager and collect your security badge from HR.",
+    "How many employees work in the sales department?",
+    "Expense reports must be submitted within 30 days with itemized receipts.",
+]
+
+# LRU size for embeddings keyed by text hash (~150MB of FP16 vectors at 768 dimensions)
+EMBEDDING_CACHE_SIZE = 100_000
+
+# Single-text encodes up to this many tokens replay a captured CUDA graph instead of launching kernels eagerly
+CUDA_GRAPH_SEQ_LEN = 128
+CUDA_GRAPH_WARMUP_ITERS = 3
+# The captured graph is dropped unless its embeddings match eager ones this closely (cosine)
+CUDA_GRAPH_MIN_COSINE = 0.999
+
+# Dummy input run at startup so cuDNN autotuning and lazy CUDA init happen before the first request
+WARMUP_TEXT = "warmup " * 64
+
+# Padded tokens (rows x longest input) per forward pass; inputs are length-sorted and packed up to this budget
+EMBED_TOKEN_BUDGET = 16384
+
+# Concurrent encode requests arriving within this window are embedded in one batch
+EMBED_BATCH_WINDOW_SECONDS = 0.005
+
+def _text_key(text: str) -> bytes:
+    """Fast 128-bit fingerprint of a text used as the embedding cache key"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
 class EmbeddingService:
     """High-performance embedding service using your RTX 4070 Ti"""
     
@@ -21,32 +67,282 @@ class EmbeddingService:
         if self.device == "cuda":
             self.model = self.model.half()  # Use FP16 for faster inference on RTX 4070 Ti
             torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
+        
+        if settings.embedding_quantization == "int8":
+            self._quantize_int8()
+        
+        # Static buffers and graph for the batch=1 encode shape (CUDA only)
+        self._graph = None
+        self._graph_inputs: Dict[str, torch.Tensor] = {}
+        self._graph_output = None
+        self._graph_lock = threading.Lock()
+        self._capture_cuda_graph()
+        self.warmup()
+        
+        # Embeddings keyed by text fingerprint; a hit skips the model forward pass entirely
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # Pending (text, future) pairs consumed by the micro-batching worker
+        self._encode_queue: queue.Queue = queue.Queue()
+        threading.Thread(target=self._encode_loop, name="embed-batcher", daemon=True).start()
         
         logger.info(f"Loaded embedding model: {settings.embedding_model}")
         logger.info(f"Model dimension: {self.model.get_sentence_embedding_dimension()}")
     
+    def _quantize_int8(self):
+        """Swap the transformer's Linear layers for INT8 ones, reverting if embeddings drift more than 1%"""
+        reference = self.model.encode(QUANTIZATION_CHECK_TEXTS, convert_to_numpy=True, show_progress_bar=False)
+        eager_model = self.model
+        replaced = []
+        try:
+            if self.device == "cuda":
+                if not USE_BITSANDBYTES:
+                    logger.info("bitsandbytes not installed, keeping FP16 embedding weights")
+                    return
+                # LLM.int8 Linear layers; LayerNorm, embeddings and residuals stay FP16
+                transformer = self.model[0].auto_model
+                for parent in list(transformer.modules()):
+                    for name, child in list(parent.named_children()):
+                        if isinstance(child, torch.nn.Linear):
+                            setattr(parent, name, self._int8_linear(child))
+                            replaced.append((parent, name, child))
+            else:
+                # Dynamic INT8 quantization of the Linear layers for CPU inference
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            
+            quantized = self.model.encode(QUANTIZATION_CHECK_TEXTS, convert_to_numpy=True, show_progress_bar=False)
+            reference = reference.astype(np.float32)
+            quantized = quantized.astype(np.float32)
+            cosines = np.sum(reference * quantized, axis=1) / (
+                np.linalg.norm(reference, axis=1) * np.linalg.norm(quantized, axis=1)
+            )
+            if cosines.min() < QUANTIZATION_MIN_COSINE:
+                raise ValueError(f"cosine drift too large (min {cosines.min():.4f})")
+            logger.info(f"Quantized embedding model to INT8 (min cosine vs original {cosines.min():.4f})")
+        except Exception as e:
+            self.model = eager_model
+            for parent, name, child in replaced:
+                setattr(parent, name, child)
+            logger.warning(f"INT8 embedding quantization unavailable, keeping original weights: {e}")
+    
+    @staticmethod
+    def _int8_linear(linear: torch.nn.Linear) -> torch.nn.Module:
+        """Build an LLM.int8 replacement for a Linear layer (weights quantize when moved to the GPU)"""
+        int8_linear = bnb.nn.Linear8bitLt(
+            linear.in_features, linear.out_features,
+            bias=linear.bias is not None, has_fp16_weights=False, threshold=6.0
+        )
+        int8_linear.weight = bnb.nn.Int8Params(linear.weight.data.cpu(), requires_grad=False, has_fp16_weights=False)
+        if linear.bias is not None:
+            int8_linear.bias = torch.nn.Parameter(linear.bias.data, requires_grad=False)
+        return int8_linear.to(linear.weight.device)
+    
+    def _capture_cuda_graph(self):
+        """Capture the transformer forward pass for one CUDA_GRAPH_SEQ_LEN-token input, keeping eager mode on failure"""
+        if self.device != "cuda":
+            return
+        try:
+            auto_model = self.model[0].auto_model
+            encoded = self._tokenize_for_graph(QUANTIZATION_CHECK_TEXTS[0])
+            static_inputs = {name: tensor.to(self.device) for name, tensor in encoded.items()}
+            
+            # Warm up on a side stream so lazy allocations happen outside the capture
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream), torch.inference_mode():
+                for _ in range(CUDA_GRAPH_WARMUP_ITERS):
+                    auto_model(**static_inputs, return_dict=False)
+            torch.cuda.current_stream().wait_stream(stream)
+            
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph), torch.inference_mode():
+                static_output = auto_model(**static_inputs, return_dict=False)[0]
+            self._graph, self._graph_inputs, self._graph_output = graph, static_inputs, static_output
+            
+            reference = self._encode_eager(QUANTIZATION_CHECK_TEXTS).astype(np.float32)
+            replayed = np.stack([self._encode_graph(text) for text in QUANTIZATION_CHECK_TEXTS]).astype(np.float32)
+            cosines = np.sum(reference * replayed, axis=1) / (
+                np.linalg.norm(reference, axis=1) * np.linalg.norm(replayed, axis=1)
+            )
+            if cosines.min() < CUDA_GRAPH_MIN_COSINE:
+                raise ValueError(f"graph output differs from eager (min cosine {cosines.min():.4f})")
+            logger.info(f"Captured CUDA graph for single-text encodes up to {CUDA_GRAPH_SEQ_LEN} tokens")
+        except Exception as e:
+            self._graph, self._graph_inputs, self._graph_output = None, {}, None
+            logger.warning(f"CUDA graph capture unavailable, encoding eagerly: {e}")
+    
+    def warmup(self):
+        """Run dummy encodes at the full batch shape and the single-text shape (results are not cached)"""
+        start = time.perf_counter()
+        self._encode_eager([WARMUP_TEXT] * settings.batch_size)
+        self._encode_uncached([WARMUP_TEXT])
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+        logger.info(f"Embedding model warmed up in {time.perf_counter() - start:.2f}s")
+    
+    def _tokenize_for_graph(self, text: str) -> Dict[str, torch.Tensor]:
+        """Tokenize one text padded to the captured sequence length"""
+        return dict(self.model.tokenizer(
+            [text], padding="max_length", max_length=CUDA_GRAPH_SEQ_LEN,
+            truncation=False, return_tensors="pt"
+        ))
+    
+    def _encode_graph(self, text: str) -> Optional[np.ndarray]:
+        """Encode one text by replaying the captured graph (None if it does not fit the captured shape)"""
+        encoded = self._tokenize_for_graph(text)
+        if encoded["input_ids"].shape[1] > CUDA_GRAPH_SEQ_LEN:
+            return None
+        
+        with self._graph_lock, torch.inference_mode():
+            for name, tensor in self._graph_inputs.items():
+                tensor.copy_(encoded[name], non_blocking=True)
+            self._graph.replay()
+            
+            # Pooling/normalization modules run eagerly on the graph's token embeddings
+            features = {
+                "input_ids": self._graph_inputs["input_ids"],
+                "attention_mask": self._graph_inputs["attention_mask"],
+                "token_embeddings": self._graph_output,
+            }
+            return self._pool(features)[0].cpu().numpy()
+    
+    def _pool(self, features: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Run the model's pooling/normalization modules on transformer token embeddings"""
+        for module in list(self.model)[1:]:
+            features = module(features)
+        return features["sentence_embedding"]
+    
+    def _encode_eager(self, texts: List[str]) -> np.ndarray:
+        """Tokenize and run the transformer directly, skipping SentenceTransformer.encode's per-call machinery"""
+        tokenizer = self.model.tokenizer
+        auto_model = self.model[0].auto_model
+        encoded = tokenizer(texts, truncation=True, max_length=self.model.max_seq_length)
+        lengths = np.array([len(ids) for ids in encoded["input_ids"]])
+        
+        row_batches = list(self._token_budget_batches(lengths))
+        
+        batches = []
+        with torch.inference_mode():
+            for rows in row_batches:
+                padded = tokenizer.pad({name: [values[i] for i in rows] for name, values in encoded.items()}, return_tensors="pt")
+                features = {name: tensor.to(self.device, non_blocking=True) for name, tensor in padded.items()}
+                features["token_embeddings"] = auto_model(**features, return_dict=False)[0]
+                batches.append(self._pool(features).cpu().numpy())
+        
+        # Scatter back to input order
+        order = np.concatenate(row_batches)
+        sorted_embeddings = np.concatenate(batches)
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        return embeddings
+    
+    @staticmethod
+    def _token_budget_batches(lengths: np.ndarray):
+        """Yield index batches of length-sorted inputs whose padded size (rows x longest) stays within EMBED_TOKEN_BUDGET"""
+        order = np.argsort(lengths, kind="stable")
+        start = 0
+        for end in range(1, len(order) + 1):
+            # Sorted ascending, so the batch's longest input is its last one
+            if end == len(order) or lengths[order[end]] * (end + 1 - start) > EMBED_TOKEN_BUDGET:
+                yield order[start:end]
+                start = end
+    
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """Run the model on texts, using the CUDA graph for a single short text"""
+        if self._graph is not None and len(texts) == 1:
+            embedding = self._encode_graph(texts[0])
+            if embedding is not None:
+                return embedding[np.newaxis, :]
+        return self._encode_eager(texts)
+    
+    def _cache_get(self, key: bytes):
+        """Look up a cached embedding, marking it most recently used"""
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._cache.move_to_end(key)
+            return embedding
+    
+    def _cache_put(self, key: bytes, embedding: np.ndarray):
+        """Cache a read-only embedding, evicting the least recently used one when full"""
+        embedding.flags.writeable = False
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            if len(self._cache) > EMBEDDING_CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
     def encode_text(self, text: str) -> np.ndarray:
         """Encode single text into vector embedding"""
-        return self.model.encode([text], convert_to_numpy=True)[0]
+        key = _text_key(text)
+        embedding = self._cache_get(key)
+        if embedding is None:
+            embedding = self._encode_uncached([text])[0]
+            self._cache_put(key, embedding)
+        return embedding
     
     def encode_batch(self, texts: List[str]) -> np.ndarray:
-        """Encode multiple texts efficiently using batch processing"""
-        return self.model.encode(
-            texts, 
-            batch_size=settings.batch_size,
-            convert_to_numpy=True,
-            show_progress_bar=False
-        )
+        """Encode multiple texts efficiently using batch processing (only cache misses hit the model)"""
+        keys = [_text_key(text) for text in texts]
+        embeddings = [self._cache_get(key) for key in keys]
+        
+        # Encode each distinct missing text once
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[i], texts[i])
+        if missing:
+            encoded = self._encode_uncached(list(missing.values()))
+            # Copy rows out so each cached vector does not pin the whole batch array
+            fresh = {key: embedding.copy() for key, embedding in zip(missing.keys(), encoded)}
+            for key, embedding in fresh.items():
+                self._cache_put(key, embedding)
+            embeddings = [fresh[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+        
+        return np.stack(embeddings) if embeddings else np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
     
-    def compute_similarity(self, query_embedding: np.ndarray, document_embeddings: List[np.ndarray]) -> List[float]:
-        """Compute cosine similarity between query and documents"""
-        similarities = []
-        for doc_embedding in document_embeddings:
-            similarity = np.dot(query_embedding, doc_embedding) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(doc_embedding)
-            )
-            similarities.append(float(similarity))
-        return similarities
+    async def encode_text_async(self, text: str) -> np.ndarray:
+        """Encode a single text through the micro-batching worker without blocking the event loop"""
+        future: Future = Future()
+        self._encode_queue.put((text, future))
+        return await asyncio.wrap_future(future)
+    
+    def _encode_loop(self):
+        """Collect encode requests arriving within a short window and embed them in one model call"""
+        while True:
+            batch = [self._encode_queue.get()]
+            deadline = time.monotonic() + EMBED_BATCH_WINDOW_SECONDS
+            while len(batch) < settings.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._encode_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                embeddings = self.encode_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+    
+    def compute_similarity(self, query_embedding: np.ndarray, document_embeddings: Union[np.ndarray, List[np.ndarray]]) -> List[float]:
+        """Compute cosine similarity between query and documents ((N, D) matrix or list of vectors)"""
+        documents = np.asarray(document_embeddings, dtype=np.float32)
+        if documents.size == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        
+        # One GEMV for all dot products, one vectorized pass for all norms
+        similarities = (documents @ query) / (np.linalg.norm(documents, axis=1) * np.linalg.norm(query))
+        return similarities.tolist()
     
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the loaded model"""
@@ -5,16 +5,65 @@ Supports DeepSeek R1, LLM, and Coder series with automatic model selection
 import os
 from typing import List, Dict, Any, Optional
 import torch
+import transformers
 from transformers import (
     AutoTokenizer, AutoModelForCausalLM, 
-    BitsAndBytesConfig, pipeline
+    BitsAndBytesConfig
 )
 import logging
 import re
-from .deepseek_models_comparison import DEEPSEEK_MODELS_RTX_4070TI, get_recommendation, OPTIMAL_SETTINGS
+from .deepseek_models_comparison import get_model_info, get_recommendation, OPTIMAL_SETTINGS
 
 logger = logging.getLogger(__name__)
 
+# Prompt + generation length, also the size of the static KV cache
+DEEPSEEK_MAX_MODEL_LEN = 2048
+
+# Generated once after loading so compilation and cache allocation happen before the first query
+WARMUP_QUERY = "How many vacation days do employees get?"
+WARMUP_CONTEXT = "[Source: policy.txt]\\nEmployees receive 20 vacation days per year."
+WARMUP_MAX_NEW_TOKENS = 8
+
+# Static start of each prompt style, up to the documents; tokenized once per model load
+PROMPT_PREFIXES = {
+    "r1": """<|im_start|>system
+You are an expert business analyst with access to company documents. Analyze the provided information carefully and give precise, well-reasoned answers.
+<|im_end|>
+
+<|im_start|>user
+Documents:
+""",
+    "coder": """# Business Data Analysis Task
+
+## Available Data:
+""",
+    "chat": """You are a helpful AI assistant that provides accurate answers based on business documents.
+
+Documents:
+""",
+}
+
+# VRAM left free for the KV cache and activations when deciding whether FP16 weights fit
+KV_CACHE_HEADROOM_GB = 2.0
+# Parameter count in a size or model name, e.g. "6.7B" / "deepseek-llm-7b-chat"
+_PARAMS_RE = re.compile(r'(\d+(?:\.\d+)?)\s*[bB]\b')
+# Leading number of a spec's accuracy range, e.g. "94" in "94-96%"
+_ACCURACY_RE = re.compile(r'(\d+(?:\.\d+)?)')
+
+# Whitespace/newline normalization for document content and generated answers
+_WS_RE = re.compile(r'\s+')
+_NL_RE = re.compile(r'\n+')
+
+# Vacation-day phrasings recognized by the rule-based fallback (matched against lowercased content)
+_VACATION_PATTERNS = [re.compile(p) for p in (
+    r'(\d+)\s*days?.*(?:per|each).*year',
+    r'(\d+)\s*vacation\s*days?',
+    r'annual.*leave.*?(\d+)\s*days?'
+)]
+
+# 7B-class models run faster in FP16 than NF4 (dequantization overhead outweighs the bandwidth saved)
+FP16_ONLY_MODEL_SIZES = ("7b", "6.7b")
+
 class EnhancedDeepSeekGenerator:
     """Enhanced DeepSeek with multi-model support and smart model selection"""
     
@@ -27,13 +76,14 @@ class EnhancedDeepSeekGenerator:
             self.model_name = preferred_model
         else:
             recommendation = get_recommendation(use_case)
-            self.model_name = recommendation["primary"]
+            self.model_name = recommendation.primary
             logger.info(f"🎯 Auto-selected {self.model_name} for {use_case}")
         
         self.tokenizer = None
         self.model = None
-        self.pipeline = None
-        self.model_info = DEEPSEEK_MODELS_RTX_4070TI.get(self.model_name, {})
+        self._eager_forward = None
+        self._prefix_ids: Dict[str, torch.Tensor] = {}
+        self.model_spec = get_model_info(self.model_name)
         
         logger.info(f"🌊 Initializing {self.model_name} on {self.device}")
         
@@ -41,8 +91,8 @@ class EnhancedDeepSeekGenerator:
         """Initialize DeepSeek model with RTX 4070 Ti optimization"""
         try:
             logger.info(f"🔥 Loading {self.model_name}...")
-            logger.info(f"📊 Expected VRAM: {self.model_info.get('vram_required', 'Unknown')}")
-            logger.info(f"🎯 Accuracy: {self.model_info.get('accuracy', 'Unknown')}")
+            logger.info(f"📊 Expected VRAM: {self.model_spec.vram_required if self.model_spec else 'Unknown'}")
+            logger.info(f"🎯 Accuracy: {self.model_spec.accuracy if self.model_spec else 'Unknown'}")
             
             # Load tokenizer
             self.tokenizer = AutoTokenizer.from_pretrained(
@@ -54,6 +104,8 @@ class EnhancedDeepSeekGenerator:
             # Add padding token if missing
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
+            # Over-long prompts lose the start of the documents rather than the question at the end
+            self.tokenizer.truncation_side = "left"
             
             # Configure quantization for larger models
             model_config = self._get_model_config()
@@ -63,14 +115,26 @@ class EnhancedDeepSeekGenerator:
                 **model_config
             )
             
-            # Create optimized pipeline
-            self.pipeline = pipeline(
-                "text-generation",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                device_map="auto",
-                return_full_text=False
-            )
+            # Static KV cache: fixed-shape K/V buffers reused across generate() calls
+            if getattr(self.model, "_supports_static_cache", False):
+                self.model.generation_config.cache_implementation = "static"
+                self.model.generation_config.max_length = DEEPSEEK_MAX_MODEL_LEN
+            else:
+                logger.info(
+                    f"ℹ️ Static KV-cache unsupported for {self.model_name} on transformers "
+                    f"{transformers.__version__}; falling back to the dynamic cache"
+                )
+            
+            self._prepare_prefix_ids()
+            
+            self._eager_forward = self.model.forward
+            # CUDA graphs need fixed shapes: with the dynamic cache every decode step has a new KV length,
+            # so reduce-overhead would recompile and re-record per length; stay eager then
+            if self.device == "cuda" and getattr(self.model.generation_config, "cache_implementation", None) == "static":
+                self._compile_model()
+            elif self.device == "cuda":
+                logger.info("ℹ️ Dynamic KV-cache in use, keeping the eager DeepSeek forward")
+            self._warmup()
             
             logger.info("✅ DeepSeek loaded successfully!")
             if torch.cuda.is_available():
@@ -86,6 +150,70 @@ class EnhancedDeepSeekGenerator:
             logger.info("🔄 Attempting fallback to smaller model...")
             self._try_fallback_model()
     
+    def _compile_model(self):
+        """Compile the forward pass (reduce-overhead mode replays CUDA graphs) to cut per-token launch overhead"""
+        try:
+            import torch._inductor.config as inductor_config
+            inductor_config.coordinate_descent_tuning = True
+            inductor_config.fx_graph_cache = True  # Reuse compiled kernels across restarts
+            
+            logger.info("⚙️ Compiling DeepSeek forward (reduce-overhead)...")
+            # generate() calls forward on the module itself, so compile the bound forward in place
+            self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=False)
+        except Exception as e:
+            self.model.forward = self._eager_forward
+            logger.warning(f"⚠️ torch.compile unavailable, using eager DeepSeek model: {e}")
+    
+    def _warmup(self):
+        """Generate a few tokens so compilation happens at load time, reverting to eager if it fails"""
+        try:
+            self._generate(WARMUP_QUERY, WARMUP_CONTEXT, WARMUP_MAX_NEW_TOKENS, temperature=0.2)
+        except Exception as e:
+            if self.model.forward is self._eager_forward:
+                raise
+            self.model.forward = self._eager_forward
+            logger.warning(f"⚠️ Compiled DeepSeek forward failed during warmup, using eager model: {e}")
+            self._generate(WARMUP_QUERY, WARMUP_CONTEXT, WARMUP_MAX_NEW_TOKENS, temperature=0.2)
+        logger.info("🔥 DeepSeek warmed up")
+    
+    def _prepare_prefix_ids(self):
+        """Tokenize the static prompt prefixes once (with BOS) and keep them on the model device"""
+        bos = [self.tokenizer.bos_token_id] if self.tokenizer.bos_token_id is not None else []
+        self._prefix_ids = {
+            style: torch.tensor([bos + self.tokenizer(prefix, add_special_tokens=False).input_ids], device=self.model.device)
+            for style, prefix in PROMPT_PREFIXES.items()
+        }
+    
+    def _encode_prompt(self, query: str, context: str, max_new_tokens: int) -> Dict[str, torch.Tensor]:
+        """Prompt token ids: the cached template prefix followed by the freshly tokenized documents and question"""
+        style = self._prompt_style()
+        prefix_ids = self._prefix_ids[style]
+        body_ids = self.tokenizer(
+            self._create_prompt_body(style, query, context),
+            return_tensors="pt", add_special_tokens=False,
+            truncation=True, max_length=DEEPSEEK_MAX_MODEL_LEN - max_new_tokens - prefix_ids.shape[1]
+        ).input_ids.to(prefix_ids.device)
+        input_ids = torch.cat([prefix_ids, body_ids], dim=1)
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+    
+    def _generate(self, query: str, context: str, max_new_tokens: int, temperature: float) -> str:
+        """Sample a completion (static KV cache when supported) and return only the newly generated text"""
+        inputs = self._encode_prompt(query, context, max_new_tokens)
+        
+        with torch.inference_mode():
+            output_ids = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                do_sample=True,
+                top_p=0.85,
+                repetition_penalty=1.1,
+                pad_token_id=self.tokenizer.eos_token_id,
+                eos_token_id=self.tokenizer.eos_token_id
+            )
+        
+        return self.tokenizer.decode(output_ids[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+    
     def _get_model_config(self) -> Dict[str, Any]:
         """Get optimized model configuration based on model size and VRAM"""
         config = {
@@ -95,21 +223,45 @@ class EnhancedDeepSeekGenerator:
             "low_cpu_mem_usage": True
         }
         
-        # Check if we need quantization
-        vram_required = self.model_info.get('vram_required', '8GB')
-        vram_gb = float(re.search(r'(\d+)', vram_required).group(1))
-        
-        if vram_gb > 8 or "V3" in self.model_name:
-            logger.info("🔧 Applying 4-bit quantization for large model")
+        # Quantize only when the FP16 weights plus KV headroom do not fit in free VRAM
+        fp16_gb = self._fp16_footprint_gb()
+        name = self.model_name.lower()
+        if self.device != "cuda":
+            use_quant = False
+        else:
+            free_gb = torch.cuda.mem_get_info()[0] / 1024**3
+            use_quant = fp16_gb is None or fp16_gb + KV_CACHE_HEADROOM_GB > free_gb
+            if use_quant and any(f"-{size}" in name for size in FP16_ONLY_MODEL_SIZES):
+                logger.warning(
+                    f"⚠️ {self.model_name} is kept in FP16, but its weights (~{fp16_gb or '?'}GB) plus "
+                    f"{KV_CACHE_HEADROOM_GB}GB KV headroom exceed the {free_gb:.1f}GB of free VRAM; "
+                    f"loading may offload layers to CPU or run out of memory"
+                )
+                use_quant = False
+        
+        if use_quant:
+            # BF16 compute on Ampere+ avoids FP16 overflow in the dequantized matmuls
+            compute_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            logger.info(f"🔧 Applying 4-bit NF4 quantization (FP16 weights ~{fp16_gb or '?'}GB do not fit, compute {compute_dtype})")
             config["quantization_config"] = BitsAndBytesConfig(
                 load_in_4bit=True,
-                bnb_4bit_compute_dtype=torch.float16,
+                bnb_4bit_compute_dtype=compute_dtype,
                 bnb_4bit_use_double_quant=True,
                 bnb_4bit_quant_type="nf4"
             )
+        else:
+            logger.info(f"⚡ Using FP16 weights (~{fp16_gb or '?'}GB), no quantization")
         
         return config
     
+    def _fp16_footprint_gb(self) -> Optional[float]:
+        """Estimated FP16 weight size (2 bytes per parameter) from the spec or model name, None if unknown"""
+        size = self.model_spec.size if self.model_spec else self.model_name
+        match = _PARAMS_RE.search(size)
+        if not match:
+            return None
+        return round(float(match.group(1)) * 2 * 1e9 / 1024**3, 1)
+    
     def _try_fallback_model(self):
         """Try to load a smaller model if the primary fails"""
         fallback_models = [
@@ -121,7 +273,7 @@ class EnhancedDeepSeekGenerator:
             if fallback != self.model_name:
                 logger.info(f"🔄 Trying fallback: {fallback}")
                 self.model_name = fallback
-                self.model_info = DEEPSEEK_MODELS_RTX_4070TI.get(fallback, {})
+                self.model_spec = get_model_info(fallback)
                 try:
                     self.initialize()
                     return
@@ -144,23 +296,16 @@ class EnhancedDeepSeekGenerator:
         # Prepare optimized context
         context = self._prepare_context(documents, query)
         
-        # Create model-specific prompt
-        prompt = self._create_optimized_prompt(query, context)
-        
-        try:            # Generate with DeepSeek
-            response = self.pipeline(
-                prompt,
+        try:            # Generate with DeepSeek (model-specific prompt)
+            generated_text = self._generate(
+                query,
+                context,
                 max_new_tokens=self._get_optimal_tokens(query),
-                temperature=0.1 if "data" in query.lower() else 0.2,
-                do_sample=True,
-                top_p=0.85,
-                repetition_penalty=1.1,
-                pad_token_id=self.tokenizer.eos_token_id,
-                eos_token_id=self.tokenizer.eos_token_id
+                temperature=0.1 if "data" in query.lower() else 0.2
             )
             
             # Extract clean answer
-            answer = self._extract_clean_answer(response[0]['generated_text'])
+            answer = self._extract_clean_answer(generated_text)
             confidence = self._calculate_confidence(answer, query, documents)
             
             return {
@@ -168,7 +313,7 @@ class EnhancedDeepSeekGenerator:
                 "confidence": confidence,
                 "source": documents[0].get('filename', 'Unknown'),
                 "model_used": self.model_name,
-                "model_accuracy": self.model_info.get('accuracy', 'Unknown')
+                "model_accuracy": self.model_spec.accuracy if self.model_spec else 'Unknown'
             }
             
         except Exception as e:
@@ -195,7 +340,7 @@ class EnhancedDeepSeekGenerator:
     def _clean_content(self, content: str, query: str) -> str:
         """Clean content with query-aware optimization"""
         # Remove excessive whitespace
-        content = re.sub(r'\\s+', ' ', content)
+        content = _WS_RE.sub(' ', content)
         
         # Query-specific length optimization
         if "coder" in self.model_name.lower() and any(word in query.lower() for word in ["csv", "data", "number", "count"]):
@@ -212,26 +357,33 @@ class EnhancedDeepSeekGenerator:
         
         return content.strip()
     
-    def _create_optimized_prompt(self, query: str, context: str) -> str:
-        """Create model-specific optimized prompt"""
-        
+    def _prompt_style(self) -> str:
+        """Prompt template family for the loaded model"""
         # Different prompt styles for different models
         if "R1" in self.model_name:
-            return self._create_r1_prompt(query, context)
+            return "r1"
         elif "coder" in self.model_name.lower():
+            return "coder"
+        else:
+            return "chat"
+    
+    def _create_optimized_prompt(self, query: str, context: str) -> str:
+        """Create model-specific optimized prompt"""
+        style = self._prompt_style()
+        return PROMPT_PREFIXES[style] + self._create_prompt_body(style, query, context)
+    
+    def _create_prompt_body(self, style: str, query: str, context: str) -> str:
+        """Prompt text after the style's static prefix"""
+        if style == "r1":
+            return self._create_r1_prompt(query, context)
+        elif style == "coder":
             return self._create_coder_prompt(query, context)
         else:
             return self._create_chat_prompt(query, context)
     
     def _create_r1_prompt(self, query: str, context: str) -> str:
-        """R1-specific prompt for advanced reasoning"""
-        return f"""<|im_start|>system
-You are an expert business analyst with access to company documents. Analyze the provided information carefully and give precise, well-reasoned answers.
-<|im_end|>
-
-<|im_start|>user
-Documents:
-{context}
+        """R1-specific prompt for advanced reasoning (after PROMPT_PREFIXES["r1"])"""
+        return f"""{context}
 
 Question: {query}
 
@@ -241,11 +393,8 @@ Please analyze the documents and provide a clear, accurate answer. If the questi
 <|im_start|>assistant"""
     
     def _create_coder_prompt(self, query: str, context: str) -> str:
-        """Coder-specific prompt for data analysis"""
-        return f"""# Business Data Analysis Task
-
-## Available Data:
-{context}
+        """Coder-specific prompt for data analysis (after PROMPT_PREFIXES["coder"])"""
+        return f"""{context}
 
 ## Query: {query}
 
@@ -253,11 +402,8 @@ Please analyze the documents and provide a clear, accurate answer. If the questi
 Based on the provided data, I need to:"""
     
     def _create_chat_prompt(self, query: str, context: str) -> str:
-        """General chat prompt for standard Q&A"""
-        return f"""You are a helpful AI assistant that provides accurate answers based on business documents.
-
-Documents:
-{context}
+        """General chat prompt for standard Q&A (after PROMPT_PREFIXES["chat"])"""
+        return f"""{context}
 
 Question: {query}
 
@@ -296,8 +442,8 @@ Answer:"""
                 answer = answer[len(prefix):].strip()
         
         # Clean up and format
-        answer = re.sub(r'\\n+', ' ', answer)  # Replace newlines with spaces
-        answer = re.sub(r'\\s+', ' ', answer)  # Normalize whitespace
+        answer = _NL_RE.sub(' ', answer)  # Replace newlines with spaces
+        answer = _WS_RE.sub(' ', answer)  # Normalize whitespace
         
         # Take first complete sentence for factual questions
         sentences = answer.split('.')
@@ -312,7 +458,9 @@ Answer:"""
     
     def _calculate_confidence(self, answer: str, query: str, documents: List[Dict[str, Any]]) -> float:
         """Calculate confidence based on answer quality and model capabilities"""
-        base_confidence = float(self.model_info.get('accuracy', '90%').rstrip('%')) / 100
+        # Accuracy is a range like "94-96%"; its lower bound is the base confidence
+        accuracy = self.model_spec.accuracy if self.model_spec else '90%'
+        base_confidence = float(_ACCURACY_RE.search(accuracy).group(1)) / 100
         
         # Adjust based on answer quality
         if len(answer) < 10:
@@ -332,14 +480,8 @@ Answer:"""
         
         # Enhanced pattern matching
         if 'vacation' in query_lower and ('day' in query_lower or 'time' in query_lower):
-            patterns = [
-                r'(\\d+)\\s*days?.*(?:per|each).*year',
-                r'(\\d+)\\s*vacation\\s*days?',
-                r'annual.*leave.*?(\\d+)\\s*days?'
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, content)
+            for pattern in _VACATION_PATTERNS:
+                match = pattern.search(content)
                 if match:
                     return {
                         "answer": f"Employees receive {match.group(1)} vacation days per year according to the policy.",
@@ -351,7 +493,7 @@ Answer:"""
         elif 'employee' in query_lower and ('most' in query_lower or 'biggest' in query_lower or 'largest' in query_lower):
             # Enhanced CSV parsing
             content_raw = documents[0].get('content', '')
-            lines = content_raw.split('\\n')
+            lines = content_raw.split('\n')
             
             departments = {}
             for line in lines[1:]:  # Skip header
@@ -387,7 +529,7 @@ Answer:"""
             "model_family": "DeepSeek",
             "use_case": self.use_case,
             "status": "loaded" if self.model else "not_loaded",
-            **self.model_info
+            **(self.model_spec.to_dict() if self.model_spec else {})
         }
         
         if torch.cuda.is_available() and self.model:
@@ -403,10 +545,11 @@ Answer:"""
         if self.model:
             del self.model
             del self.tokenizer
-            del self.pipeline
+            self._eager_forward = None
+            self._prefix_ids = {}
             torch.cuda.empty_cache()
         
         # Load new model
         self.model_name = new_model
-        self.model_info = DEEPSEEK_MODELS_RTX_4070TI.get(new_model, {})
+        self.model_spec = get_model_info(new_model)
         self.initialize()
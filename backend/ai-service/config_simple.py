@@ -17,6 +17,7 @@ class Settings(BaseSettings):
     vector_dimension: int = 384
     similarity_threshold: float = 0.2
     max_results: int = 10
+    embedding_corpus_path: str = "data/embedding_corpus.f16"  # Memory-mapped float16 matrix of normalized document embeddings (one file per worker, pid added)
     
     # Logging
     log_level: str = "INFO"
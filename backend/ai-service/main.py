@@ -92,6 +92,7 @@ async def lifespan(app: FastAPI):
     logger.info("🧠 Embedding service initialized")
       # Initialize document processor
     document_processor = DocumentProcessor()
+    document_processor.start()
     logger.info("📄 Document processor initialized")    # Initialize answer generation service
     answer_service = SmartAnswerGenerator()
     answer_service.initialize = lambda: None  # No initialization needed
@@ -107,6 +108,7 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("🛑 Shutting down QuerySense AI Service")
+    document_processor.shutdown()
 
 # Initialize FastAPI app with lifespan
 app = FastAPI(
@@ -159,7 +161,7 @@ async def create_embedding(request: EmbedRequest):
         raise HTTPException(status_code=503, detail="Embedding service not available")
     
     try:
-        embedding = embedding_service.encode_text(request.text)
+        embedding = await embedding_service.encode_text_async(request.text)
         model_info = embedding_service.get_model_info()
         
         return EmbedResponse(
@@ -179,8 +181,8 @@ async def calculate_similarity(request: SimilarityRequest):
         raise HTTPException(status_code=503, detail="Embedding service not available")
     
     try:
-        embedding1 = embedding_service.encode_text(request.text1)
-        embedding2 = embedding_service.encode_text(request.text2)
+        embedding1 = await embedding_service.encode_text_async(request.text1)
+        embedding2 = await embedding_service.encode_text_async(request.text2)
         
         # Calculate cosine similarity
         similarity = np.dot(embedding1, embedding2) / (
@@ -222,7 +224,7 @@ async def upload_documents(
             processed_content = await document_processor.process_file(content, file.filename)
             
             # Generate embedding
-            embedding = embedding_service.encode_text(processed_content)
+            embedding = await embedding_service.encode_text_async(processed_content)
             
             # Save to database
             db_document = Document(
@@ -266,7 +268,7 @@ async def semantic_search(
     
     try:
         # Generate query embedding
-        query_embedding = embedding_service.encode_text(request.query)
+        query_embedding = await embedding_service.encode_text_async(request.query)
         
         # Get all documents from database
         documents = db.query(Document).all()
@@ -4,6 +4,7 @@ GPU-accelerated semantic search with document storage
 """
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
@@ -16,8 +17,11 @@ import json
 from contextlib import asynccontextmanager
 
 from config_simple import settings
-from app.database_simple import get_db, create_tables, Document, QueryHistory, test_connection
+from app.database_simple import (
+    get_db, SessionLocal, create_tables, Document, QueryHistory, test_connection, encode_embedding, decode_embedding
+)
 from app.embedding_service import EmbeddingService
+from app.embedding_index import EmbeddingIndex
 from app.document_processor import DocumentProcessor
 from app.answer_generation_ai import AIAnswerGenerationService
 
@@ -27,6 +31,7 @@ logger = logging.getLogger(__name__)
 
 # Global services
 embedding_service: Optional[EmbeddingService] = None
+embedding_index: Optional[EmbeddingIndex] = None
 document_processor: Optional[DocumentProcessor] = None
 answer_service: Optional[AIAnswerGenerationService] = None
 
@@ -73,7 +78,7 @@ class DocumentResponse(BaseModel):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler"""
-    global embedding_service, document_processor, answer_service
+    global embedding_service, embedding_index, document_processor, answer_service
     
     logger.info("🚀 Starting QuerySense AI Service Phase 2")
     logger.info(f"🎯 Using device: {settings.device}")
@@ -90,8 +95,20 @@ async def lifespan(app: FastAPI):
     # Initialize embedding service
     embedding_service = EmbeddingService()
     logger.info("🧠 Embedding service initialized")
+    
+    # Normalize all stored embeddings once into the memory-mapped search matrix
+    embedding_index = EmbeddingIndex(settings.embedding_corpus_path)
+    db = SessionLocal()
+    try:
+        embedding_index.load([
+            (doc_id, decode_embedding(embedding))
+            for doc_id, embedding in db.query(Document.id, Document.embedding).all()
+        ])
+    finally:
+        db.close()
       # Initialize document processor
     document_processor = DocumentProcessor()
+    document_processor.start()
     logger.info("📄 Document processor initialized")
     
     # Initialize answer generation service
@@ -108,6 +125,8 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("🛑 Shutting down QuerySense AI Service")
+    document_processor.shutdown()
+    embedding_index.close()
 
 # Initialize FastAPI app with lifespan
 app = FastAPI(
@@ -160,7 +179,7 @@ async def create_embedding(request: EmbedRequest):
         raise HTTPException(status_code=503, detail="Embedding service not available")
     
     try:
-        embedding = embedding_service.encode_text(request.text)
+        embedding = await embedding_service.encode_text_async(request.text)
         model_info = embedding_service.get_model_info()
         
         return EmbedResponse(
@@ -180,8 +199,8 @@ async def calculate_similarity(request: SimilarityRequest):
         raise HTTPException(status_code=503, detail="Embedding service not available")
     
     try:
-        embedding1 = embedding_service.encode_text(request.text1)
-        embedding2 = embedding_service.encode_text(request.text2)
+        embedding1 = await embedding_service.encode_text_async(request.text1)
+        embedding2 = await embedding_service.encode_text_async(request.text2)
         
         # Calculate cosine similarity
         similarity = np.dot(embedding1, embedding2) / (
@@ -209,7 +228,7 @@ async def upload_documents(
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
     
-    if not embedding_service or not document_processor:
+    if not embedding_service or embedding_index is None or not document_processor:
         raise HTTPException(status_code=503, detail="AI services not available")
     
     results = []
@@ -223,7 +242,7 @@ async def upload_documents(
             processed_content = await document_processor.process_file(content, file.filename)
             
             # Generate embedding
-            embedding = embedding_service.encode_text(processed_content)
+            embedding = await embedding_service.encode_text_async(processed_content)
             
             # Save to database
             db_document = Document(
@@ -231,12 +250,13 @@ async def upload_documents(
                 content=processed_content,
                 file_type=file.content_type or "unknown",
                 file_size=len(content),
-                embedding=embedding.tolist()  # Convert numpy array to list for JSON storage
+                embedding=encode_embedding(embedding)  # float16 bytes for BYTEA storage
             )
             
             db.add(db_document)
             db.commit()
             db.refresh(db_document)
+            embedding_index.add(db_document.id, embedding)
             
             results.append(DocumentResponse(
                 id=str(db_document.id),
@@ -254,6 +274,40 @@ async def upload_documents(
     
     return results
 
+async def _search_documents(request: QueryRequest, db: Session):
+    """Embed the query and return it with the best matching documents, in similarity order"""
+    # Generate query embedding
+    query_embedding = await embedding_service.encode_text_async(request.query)
+    
+    if not len(embedding_index):
+        return query_embedding, []
+    
+    # Score every stored embedding at once, keeping the best matches above the threshold
+    matches = embedding_index.search(query_embedding, request.max_results, request.similarity_threshold)
+    
+    # Fetch only the matched documents, preserving similarity order
+    matched_ids = [doc_id for doc_id, _ in matches]
+    documents = {doc.id: doc for doc in db.query(Document).filter(Document.id.in_(matched_ids)).all()} if matched_ids else {}
+    similarities = [
+        {"document": documents[doc_id], "similarity": similarity}
+        for doc_id, similarity in matches
+        if doc_id in documents
+    ]
+    
+    # Format results
+    results = []
+    for item in similarities:
+        doc = item["document"]
+        results.append({
+            "id": str(doc.id),
+            "filename": doc.filename,
+            "content": doc.content[:500] + "..." if len(doc.content) > 500 else doc.content,
+            "similarity": item["similarity"],
+            "file_type": doc.file_type,
+            "upload_timestamp": doc.upload_timestamp.isoformat()
+        })
+    return query_embedding, results
+
 @app.post("/query", response_model=QueryResponse)
 async def semantic_search(
     request: QueryRequest,
@@ -266,13 +320,7 @@ async def semantic_search(
         raise HTTPException(status_code=503, detail="Embedding service not available")
     
     try:
-        # Generate query embedding
-        query_embedding = embedding_service.encode_text(request.query)
-        
-        # Get all documents from database
-        documents = db.query(Document).all()
-        
-        if not documents:
+        if not len(embedding_index):
             return QueryResponse(
                 query=request.query,
                 answer="I couldn't find any documents to answer your question.",
@@ -282,45 +330,13 @@ async def semantic_search(
                 response_time_ms=int((time.time() - start_time) * 1000)
             )
         
-        # Calculate similarities
-        similarities = []
-        for doc in documents:
-            # Convert JSON back to numpy array
-            doc_embedding = np.array(doc.embedding)
-            
-            # Calculate cosine similarity
-            similarity = np.dot(query_embedding, doc_embedding) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(doc_embedding)
-            )
-            
-            if similarity >= request.similarity_threshold:
-                similarities.append({
-                    "document": doc,
-                    "similarity": float(similarity)
-                })
+        query_embedding, results = await _search_documents(request, db)
         
-        # Sort by similarity (highest first)
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        
-        # Limit results
-        similarities = similarities[:request.max_results]
-        
-        # Format results
-        results = []
-        for item in similarities:
-            doc = item["document"]
-            results.append({
-                "id": str(doc.id),
-                "filename": doc.filename,
-                "content": doc.content[:500] + "..." if len(doc.content) > 500 else doc.content,
-                "similarity": item["similarity"],
-                "file_type": doc.file_type,
-                "upload_timestamp": doc.upload_timestamp.isoformat()
-            })        # Generate answer from retrieved documents
+        # Generate answer from retrieved documents
         answer_text = None
         answer_source = None
         if answer_service and results:
-            answer_result = answer_service.generate_answer(request.query, results)
+            answer_result = await answer_service.generate_answer(request.query, results)
             if isinstance(answer_result, dict):
                 answer_text = answer_result.get("answer")
                 answer_source = answer_result.get("source")
@@ -332,7 +348,7 @@ async def semantic_search(
         # Save query to history
         query_history = QueryHistory(
             query_text=request.query,
-            query_embedding=query_embedding.tolist(),
+            query_embedding=encode_embedding(query_embedding),
             results_count=len(results),
             response_time_ms=response_time_ms
         )
@@ -354,6 +370,26 @@ async def semantic_search(
         logger.error(f"❌ Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post("/query/stream")
+async def semantic_search_stream(
+    request: QueryRequest,
+    db: Session = Depends(get_db)
+):
+    """Perform semantic search and stream the generated answer as plain text"""
+    if not embedding_service:
+        raise HTTPException(status_code=503, detail="Embedding service not available")
+    if not answer_service:
+        raise HTTPException(status_code=503, detail="Answer service not available")
+    
+    try:
+        _, results = await _search_documents(request, db)
+    except Exception as e:
+        logger.error(f"❌ Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+    
+    logger.info(f"🔍 Streaming query: '{request.query}' | Results: {len(results)}")
+    return StreamingResponse(answer_service.stream_answer(request.query, results), media_type="text/plain")
+
 @app.get("/documents", response_model=List[DocumentResponse])
 async def list_documents(db: Session = Depends(get_db)):
     """List all uploaded documents"""
@@ -75,6 +75,7 @@ async def reset_and_improve_system():
     
     db.commit()
     db.close()
+    document_processor.shutdown()
     
     logger.info("🎉 System reset complete! Your QuerySense should now perform much better.")
     logger.info("📋 Test with these questions:")
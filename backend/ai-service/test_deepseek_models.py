@@ -15,7 +15,7 @@ from sqlalchemy.orm import Session
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from app.enhanced_deepseek_generator import EnhancedDeepSeekGenerator
-from app.deepseek_models_comparison import DEEPSEEK_MODELS_RTX_4070TI
+from app.deepseek_models_comparison import get_model_info
 
 # Try to import database
 try:
@@ -194,7 +194,7 @@ def test_model_accuracy():
         generator.initialize()
         
         print(f"🤖 Testing with: {generator.model_name}")
-        print(f"🎯 Expected Accuracy: {generator.model_info.get('accuracy', 'Unknown')}")
+        print(f"🎯 Expected Accuracy: {generator.model_spec.accuracy if generator.model_spec else 'Unknown'}")
         print()
         
         for i, question in enumerate(test_questions, 1):
@@ -316,12 +316,12 @@ def main():
         
         for model in model_preference:
             if model in successful_models:
-                info = DEEPSEEK_MODELS_RTX_4070TI.get(model, {})
+                info = get_model_info(model)
                 model_short = model.split('/')[-1]
                 print(f"\\n🥇 {model_short}")
-                print(f"   Accuracy: {info.get('accuracy', 'Unknown')}")
-                print(f"   VRAM: {info.get('vram_required', 'Unknown')}")
-                print(f"   Best for: {info.get('recommended_use', 'General use')}")
+                print(f"   Accuracy: {info.accuracy if info else 'Unknown'}")
+                print(f"   VRAM: {info.vram_required if info else 'Unknown'}")
+                print(f"   Best for: {info.recommended_use if info else 'General use'}")
                 break
         
         print("\\n📝 NEXT STEPS:")